@@ -0,0 +1,59 @@
+"""Cold-start harness: import + client init time of lambda_function per request path.
+
+Each sample runs in a fresh interpreter so module imports are really cold.
+Client construction doesn't call AWS, so no credentials are needed.
+
+    python benchmarks/bench_cold_start.py [samples]
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-function')
+
+# Clients each request path touches on its first invocation
+PATHS = {
+    'dine-in': ['get_orders_table', 'get_iot_client'],
+    'stripe-webhook': ['get_stripe', 'get_orders_table', 'get_iot_client', 'get_ses_client'],
+}
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import lambda_function
+t1 = time.perf_counter()
+for getter in sys.argv[1:]:
+    getattr(lambda_function, getter)()
+t2 = time.perf_counter()
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'init_ms': (t2 - t1) * 1000}))
+"""
+
+
+def sample(getters):
+    env = {
+        **os.environ,
+        'AWS_DEFAULT_REGION': os.environ.get('AWS_DEFAULT_REGION', 'ca-central-1'),
+        'DYNAMODB_TABLE_NAME': os.environ.get('DYNAMODB_TABLE_NAME', 'bench-orders'),
+        'PRINTER_TOPIC': os.environ.get('PRINTER_TOPIC', 'printers/orders/print'),
+    }
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE, *getters],
+        cwd=LAMBDA_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print(f"{'path':<16} {'import ms':>10} {'init ms':>10} {'total ms':>10}  (median of {samples})")
+    for path, getters in PATHS.items():
+        runs = [sample(getters) for _ in range(samples)]
+        imp = statistics.median(r['import_ms'] for r in runs)
+        init = statistics.median(r['init_ms'] for r in runs)
+        print(f"{path:<16} {imp:>10.1f} {init:>10.1f} {imp + init:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
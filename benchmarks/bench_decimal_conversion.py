@@ -0,0 +1,91 @@
+"""Benchmark: float -> Decimal conversion of large order payloads in process_order.
+
+Compares the old flow (json.loads, then replace_floats_with_decimals rebuilding
+the whole order and again the items) with parse_float=Decimal plus the
+copy-on-write single pass.
+
+    python benchmarks/bench_decimal_conversion.py [items] [iterations]
+"""
+import os
+import sys
+import json
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-function'))
+
+from lambda_function import replace_floats_with_decimals  # noqa: E402
+
+
+def old_replace_floats_with_decimals(obj):
+    if isinstance(obj, list):
+        return [old_replace_floats_with_decimals(i) for i in obj]
+    elif isinstance(obj, dict):
+        return {k: old_replace_floats_with_decimals(v) for k, v in obj.items()}
+    elif isinstance(obj, float):
+        return Decimal(str(obj))
+    else:
+        return obj
+
+
+def make_order(n_items):
+    return {
+        'order_id': 'bench-order',
+        'orderType': 'dine-in',
+        'table': 'table-7',
+        'total': 12.75 * n_items,
+        'items': [
+            {
+                'cartId': f'cart-{i}',
+                'quantity': 1 + i % 3,
+                'finalPrice': 12.75,
+                'menuItem': {
+                    'id': str(i),
+                    'name': f'Dragon Roll {i}',
+                    'Price': 11.5,
+                    'category': 'special-roll',
+                    'location': 'front',
+                    'options': [
+                        {'name': 'Size', 'type': 'VARIANT', 'required': True,
+                         'items': [{'name': 'Regular', 'priceModifier': 0.0}, {'name': 'Large', 'priceModifier': 1.25}]},
+                        {'name': 'Extras', 'type': 'ADD_ON', 'required': False,
+                         'items': [{'name': 'Avocado', 'priceModifier': 1.0}, {'name': 'Tobiko', 'priceModifier': 1.5}]},
+                    ],
+                },
+                'selectedOptions': {'Size': {'name': 'Large', 'priceModifier': 1.25}},
+            }
+            for i in range(n_items)
+        ],
+    }
+
+
+def old_flow(body):
+    order_data = json.loads(body)
+    order_data_decimal = old_replace_floats_with_decimals(order_data)
+    return old_replace_floats_with_decimals(order_data_decimal['items'])
+
+
+def new_flow(body):
+    order_data = json.loads(body, parse_float=Decimal)
+    order_data_decimal = replace_floats_with_decimals(order_data)
+    return order_data_decimal['items']
+
+
+def main():
+    n_items = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    body = json.dumps(make_order(n_items))
+    assert old_flow(body) == new_flow(body)
+
+    print(f"{n_items} items, {len(body)} byte body, {iterations} iterations")
+    for label, fn in [('old: json.loads + 2x rebuild', old_flow), ('new: parse_float + 1 pass', new_flow)]:
+        per_call = timeit.timeit(lambda: fn(body), number=iterations) / iterations
+        print(f"  {label:<30} {per_call * 1000:8.3f} ms/order")
+
+    parsed = json.loads(body, parse_float=Decimal)
+    per_call = timeit.timeit(lambda: replace_floats_with_decimals(parsed), number=iterations) / iterations
+    print(f"  {'no-op pass on Decimal payload':<30} {per_call * 1000:8.3f} ms/order")
+
+
+if __name__ == '__main__':
+    main()
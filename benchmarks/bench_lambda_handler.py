@@ -0,0 +1,428 @@
+"""Load test for lambda_handler against in-process fakes of DynamoDB, IoT Data, SES and Stripe.
+
+Drives the real handler with synthetic dine-in orders and Stripe-signed
+`payment_intent.succeeded` webhooks and reports:
+
+  - warm latency p50/p95/p99 and throughput per request type, at each
+    requested concurrency (threads in one interpreter, i.e. one container
+    serving overlapping requests; the fakes sleep to model AWS round trips),
+    per scenario:
+      base           receipts sent inline through SES
+      receipt-queue  RECEIPT_QUEUE_URL set: webhooks queue receipts on SQS
+      rollups        ROLLUP_TABLE_NAME set; also times the orders stream
+                     consumer applying the load's orders to the rollups
+  - cold start, each sample in a fresh interpreter: the real lambda_function
+    import, real stripe/boto3 client construction for the request path (as in
+    bench_cold_start.py; "not measured" if they aren't installed), then the
+    first and second request against the fakes
+  - allocations per request (tracemalloc, separate sequential pass; "retained"
+    includes what the fakes keep, e.g. the stored order and published payload)
+
+Before the load test it checks the queued-receipt round trip: webhooks queue
+their receipts on an InMemoryReceiptQueue, the SQS batch consumer sends each
+one exactly once, and a bad message comes back in batchItemFailures.
+
+Save a run with --save and compare a later one with --compare; the script
+exits non-zero if a p95 regresses by more than --tolerance, so it can gate
+a deploy.
+
+    python benchmarks/bench_lambda_handler.py [--requests 400] [--concurrency 1 4 16]
+        [--stripe-share 0.5] [--scenarios base receipt-queue rollups]
+        [--save baseline.json | --compare baseline.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import logging
+import threading
+import argparse
+import statistics
+import subprocess
+import tracemalloc
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+WEBHOOK_SECRET = 'whsec_bench'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ca-central-1')
+os.environ.setdefault('DYNAMODB_TABLE_NAME', 'bench-orders')
+os.environ.setdefault('PRINTER_TOPIC', 'printers/orders/print')
+os.environ.setdefault('SENDER_EMAIL', 'orders@example.com')
+os.environ.setdefault('STRIPE_WEBHOOK_SECRET', WEBHOOK_SECRET)
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'lambda-function'))
+sys.path.insert(0, BENCH_DIR)
+
+from fakes import FakeIotData, FakeSes, FakeStripe, FakeTable, install_fakes, make_charge, sign_webhook  # noqa: E402
+from receipt_queue import InMemoryReceiptQueue  # noqa: E402
+
+# Rough in-region round trips, in seconds
+LATENCY = {'dynamodb': 0.008, 'iot': 0.012, 'ses': 0.040, 'sqs': 0.010, 'stripe': 0.150}
+# Settings lambda_function reads at import, per scenario
+SCENARIOS = {
+    'base': {},
+    'receipt-queue': {'RECEIPT_QUEUE_URL': 'https://sqs.ca-central-1.amazonaws.com/000000000000/bench-receipts'},
+    'rollups': {'ROLLUP_TABLE_NAME': 'bench-rollups'},
+}
+MENU = [('Dragon Roll', '14.95', 'front'), ('Salmon Nigiri', '6.50', 'front'),
+        ('Chicken Teriyaki', '16.25', 'back'), ('Miso Soup', '3.25', 'back'), ('Edamame', '4.95', 'back')]
+
+
+class Context:
+    def __init__(self, request_id):
+        self.aws_request_id = request_id
+
+
+def make_items(rng):
+    items = []
+    for name, price, location in rng.sample(MENU, rng.randint(1, len(MENU))):
+        quantity = rng.randint(1, 3)
+        items.append({'id': name.lower().replace(' ', '-'), 'name': name, 'price': float(price), 'quantity': quantity,
+                      'subtotal': round(float(price) * quantity, 2), 'location': location,
+                      'options': 'Spice: Mild; Extra ginger' if location == 'front' else ''})
+    return items
+
+
+def dine_in_event(i, rng):
+    items = make_items(rng)
+    body = {'items': items, 'total': round(sum(item['subtotal'] for item in items), 2),
+            'order_id': f"D{i:06d}", 'notes': '', 'table': f"table-{i % 20}", 'orderType': 'dine-in'}
+    return {'httpMethod': 'POST', 'headers': {'content-type': 'application/json'}, 'body': json.dumps(body)}
+
+
+def stripe_event(i, rng, stripe):
+    """Signed webhook for a takeout payment; the charge is fetched with Charge.retrieve."""
+    items = make_items(rng)
+    subtotal_cents = int(round(sum(item['subtotal'] for item in items) * 100))
+    tax_cents = int(round(subtotal_cents * 0.13))
+    charge_id = f"ch_bench{i:06d}"
+    stripe.charges[charge_id] = make_charge(charge_id, email=f"guest{i}@example.com", brand=rng.choice(['visa', 'mastercard', 'amex']))
+    payload = json.dumps({
+        'id': f"evt_bench{i:06d}",
+        'type': 'payment_intent.succeeded',
+        'data': {'object': {
+            'id': f"pi_bench{i:06d}",
+            'object': 'payment_intent',
+            'created': int(time.time()),
+            'latest_charge': charge_id,
+            'metadata': {
+                'order_id': f"T{i:06d}",
+                'orderType': 'takeout',
+                'total': f"{(subtotal_cents + tax_cents) / 100:.2f}",
+                'subtotal_cents': str(subtotal_cents),
+                'tax_total_cents': str(tax_cents),
+                'items_summary': json.dumps([{'name': it['name'], 'quantity': it['quantity'], 'finalPrice': it['price']}
+                                             for it in items]),
+            },
+        }},
+    })
+    return {'httpMethod': 'POST', 'headers': {'stripe-signature': sign_webhook(payload, WEBHOOK_SECRET)}, 'body': payload}
+
+
+def build_events(n, stripe_share, stripe, seed=7):
+    rng = random.Random(seed)
+    events = []
+    for i in range(n):
+        if rng.random() < stripe_share:
+            events.append(('stripe', stripe_event(i, rng, stripe)))
+        else:
+            events.append(('dine-in', dine_in_event(i, rng)))
+    return events
+
+
+class SlowReceiptQueue(InMemoryReceiptQueue):
+    """InMemoryReceiptQueue that sleeps like an SQS SendMessage round trip."""
+
+    def __init__(self, latency):
+        super().__init__()
+        self.latency = latency
+        self._lock = threading.Lock()
+
+    def send(self, body):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            return super().send(body)
+
+
+def configure(lambda_function, scenario):
+    """Sets the scenario's settings on an imported lambda_function and drops the clients they gate."""
+    settings = SCENARIOS[scenario]
+    lambda_function.RECEIPT_QUEUE_URL = settings.get('RECEIPT_QUEUE_URL')
+    lambda_function.ROLLUP_TABLE_NAME = settings.get('ROLLUP_TABLE_NAME')
+    lambda_function._clients.pop('receipt_queue', None)
+    lambda_function._clients.pop('rollup_table', None)
+
+
+def install(lambda_function, latency, scenario='base', receipt_queue=None):
+    configure(lambda_function, scenario)
+    if scenario == 'receipt-queue' and receipt_queue is None:
+        receipt_queue = SlowReceiptQueue(latency['sqs'])
+    fakes = {
+        'stripe': FakeStripe(latency=latency['stripe']),
+        'orders_table': FakeTable('orderId', latency=latency['dynamodb'], name='bench-orders'),
+        'rollup_table': (FakeTable(('pk', 'sk'), latency=latency['dynamodb'], name='bench-rollups')
+                         if scenario == 'rollups' else None),
+        'iot_data': FakeIotData(latency=latency['iot']),
+        'ses': FakeSes(latency=latency['ses']),
+        'receipt_queue': receipt_queue,
+    }
+    install_fakes(lambda_function, **fakes)
+    return fakes
+
+
+def invoke(lambda_function, kind, event, request_id):
+    started = time.perf_counter()
+    response = lambda_function.lambda_handler(event, Context(request_id))
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return kind, elapsed_ms, response['statusCode']
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        value = samples[0] if samples else 0.0
+        return {'p50': value, 'p95': value, 'p99': value}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
+
+
+def run_load(lambda_function, events, concurrency):
+    """Runs every event through the handler on `concurrency` threads."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(lambda args: invoke(lambda_function, *args),
+                                [(kind, event, f"req-{i}") for i, (kind, event) in enumerate(events)]))
+    wall = time.perf_counter() - started
+    report = {'concurrency': concurrency, 'requests': len(results), 'seconds': wall,
+              'throughput': len(results) / wall, 'errors': sum(1 for _, _, status in results if status != 200)}
+    for kind in sorted({kind for kind, _, _ in results}):
+        samples = [ms for k, ms, _ in results if k == kind]
+        report[kind] = {'count': len(samples), 'mean': statistics.fmean(samples), **percentiles(samples)}
+    return report
+
+
+def measure_stream(lambda_function, orders_table, batch_size=100):
+    """Drains the orders table's stream through lambda_handler, as the rollup event source mapping would."""
+    batches = []
+    records = 0
+    while orders_table.stream:
+        event = orders_table.drain_stream_event(batch_size)
+        started = time.perf_counter()
+        response = lambda_function.lambda_handler(event, Context('order-stream'))
+        batches.append((time.perf_counter() - started) * 1000)
+        assert not response['batchItemFailures'], f"rollup failures: {response['batchItemFailures']}"
+        records += len(event['Records'])
+    return {'batches': len(batches), 'records': records, 'ms_per_order': sum(batches) / max(records, 1),
+            **percentiles(batches)}
+
+
+def measure_allocations(lambda_function, events):
+    """Average bytes allocated (peak) and left behind per request, per request type."""
+    per_kind = {}
+    tracemalloc.start()
+    try:
+        for i, (kind, event) in enumerate(events):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            invoke(lambda_function, kind, event, f"alloc-{i}")
+            after, peak = tracemalloc.get_traced_memory()
+            stats = per_kind.setdefault(kind, {'count': 0, 'peak': 0, 'retained': 0})
+            stats['count'] += 1
+            stats['peak'] += peak - before
+            stats['retained'] += after - before
+    finally:
+        tracemalloc.stop()
+    return {kind: {'peak_kib': s['peak'] / s['count'] / 1024, 'retained_kib': s['retained'] / s['count'] / 1024}
+            for kind, s in per_kind.items()}
+
+
+def check_receipt_queue(lambda_function, n=20):
+    """Webhook -> queue_or_send_receipt -> InMemoryReceiptQueue -> handle_receipt_batch -> SES, once each."""
+    queue = InMemoryReceiptQueue()
+    try:
+        fakes = install(lambda_function, {name: 0.0 for name in LATENCY}, 'receipt-queue', receipt_queue=queue)
+        events = build_events(n, 1.0, fakes['stripe'], seed=3)
+        for i, (kind, event) in enumerate(events):
+            assert invoke(lambda_function, kind, event, f"queue-{i}")[2] == 200, "webhook failed"
+        assert not fakes['ses'].sent, "receipts were sent inline instead of queued"
+        assert len(queue.messages) == n, f"expected {n} queued receipts, got {len(queue.messages)}"
+
+        failures = []
+        while queue.messages:
+            response = lambda_function.lambda_handler(queue.drain_as_sqs_event(), Context('receipt-batch'))
+            failures.extend(response['batchItemFailures'])
+        assert not failures, f"receipt batch failures: {failures}"
+        recipients = [email['Destination']['ToAddresses'][0] for email in fakes['ses'].sent]
+        expected = [f"guest{i}@example.com" for i in range(n)]
+        assert sorted(recipients) == sorted(expected), "each queued receipt must be sent exactly once"
+
+        poison = {'Records': [{'messageId': 'poison', 'body': '{not json', 'eventSource': 'aws:sqs'}]}
+        logging.disable(logging.ERROR) # The consumer logs the expected decode error with a traceback
+        try:
+            response = lambda_function.lambda_handler(poison, Context('receipt-batch'))
+        finally:
+            logging.disable(logging.NOTSET)
+        assert response['batchItemFailures'] == [{'itemIdentifier': 'poison'}], response
+    finally:
+        configure(lambda_function, 'base')
+    return {'queued': n, 'sent': len(recipients), 'batch_failures_reported': len(response['batchItemFailures'])}
+
+
+# --- Cold Start ---
+# Each sample is a fresh interpreter. Like bench_cold_start.py it times the
+# real lambda_function import and the real stripe/boto3 client construction
+# the request path needs; only then are the fakes installed, to time the first
+# and second request of one kind without network calls.
+COLD_PATHS = {
+    ('dine-in', 'base'): ['get_orders_table', 'get_iot_client'],
+    ('stripe', 'base'): ['get_stripe', 'get_orders_table', 'get_iot_client', 'get_ses_client'],
+    ('stripe', 'receipt-queue'): ['get_stripe', 'get_orders_table', 'get_iot_client', 'get_receipt_queue'],
+}
+
+COLD_PROBE = """
+import os, sys, json, time, io, contextlib
+sys.path[:0] = [os.path.join({bench_dir!r}, '..', 'lambda-function'), {bench_dir!r}]
+kind, scenario, latency, getters = sys.argv[1], sys.argv[2], json.loads(sys.argv[3]), json.loads(sys.argv[4])
+t0 = time.perf_counter()
+import lambda_function
+t1 = time.perf_counter()
+init_ms = init_error = None
+try:
+    for getter in getters:
+        getattr(lambda_function, getter)()
+    init_ms = (time.perf_counter() - t1) * 1000
+except Exception as e: # stripe/boto3 not installed, or not usable here
+    init_error = f"{{type(e).__name__}}: {{e}}"
+import bench_lambda_handler as bench
+fakes = bench.install(lambda_function, latency, scenario)
+events = [e for e in bench.build_events(50, 1.0 if kind == 'stripe' else 0.0, fakes['stripe']) if e[0] == kind]
+with contextlib.redirect_stdout(io.StringIO()):
+    first = bench.invoke(lambda_function, kind, events[0][1], 'cold')[1]
+    second = bench.invoke(lambda_function, kind, events[1][1], 'warm')[1]
+print(json.dumps({{'import_ms': (t1 - t0) * 1000, 'init_ms': init_ms, 'init_error': init_error,
+                  'first_ms': first, 'second_ms': second}}))
+"""
+
+
+def measure_cold(kind, scenario, samples, latency):
+    env = {**os.environ, **SCENARIOS[scenario]}
+    getters = COLD_PATHS[kind, scenario]
+    runs = []
+    for _ in range(samples):
+        out = subprocess.run(
+            [sys.executable, '-c', COLD_PROBE.format(bench_dir=BENCH_DIR), kind, scenario, json.dumps(latency),
+             json.dumps(getters)],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    cold = {key: statistics.median(run[key] for run in runs) for key in ('import_ms', 'first_ms', 'second_ms')}
+    init = [run['init_ms'] for run in runs if run['init_ms'] is not None]
+    cold['init_ms'] = statistics.median(init) if len(init) == len(runs) else None
+    cold['init_error'] = next((run['init_error'] for run in runs if run['init_error']), None)
+    return cold
+
+
+def print_report(results):
+    queue = results.get('receipt_queue')
+    if queue:
+        print(f"receipt queue: {queue['queued']} queued, {queue['sent']} sent once by the batch consumer, "
+              f"bad message reported in batchItemFailures\n")
+    print(f"{'scenario':<13} {'conc':>4} {'type':<8} {'n':>5} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}"
+          f"   (ms)  req/s  errors")
+    for load in results['load']:
+        kinds = [k for k in ('dine-in', 'stripe') if k in load]
+        for index, kind in enumerate(kinds):
+            r = load[kind]
+            tail = f"{load['throughput']:>7.1f} {load['errors']:>6}" if index == 0 else ''
+            print(f"{load.get('scenario', 'base'):<13} {load['concurrency']:>4} {kind:<8} {r['count']:>5} "
+                  f"{r['mean']:>8.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['p99']:>8.1f}  {tail}")
+    for load in results['load']:
+        stream = load.get('stream')
+        if stream:
+            print(f"rollup stream @ {load['concurrency']} threads: {stream['records']} orders in {stream['batches']} "
+                  f"batch(es), p50 {stream['p50']:.1f} ms/batch, {stream['ms_per_order']:.2f} ms/order")
+    print()
+    for path, cold in results['cold'].items():
+        init = (f"client init {cold['init_ms']:>6.1f} ms" if cold['init_ms'] is not None
+                else f"client init not measured ({cold['init_error']})")
+        total = cold['import_ms'] + (cold['init_ms'] or 0) + cold['first_ms']
+        print(f"cold {path:<20} import {cold['import_ms']:>6.1f} ms, {init}, first request {cold['first_ms']:>6.1f} ms, "
+              f"second {cold['second_ms']:>6.1f} ms, total {total:>6.1f} ms")
+    for kind, alloc in results['allocations'].items():
+        print(f"alloc {kind:<7} peak {alloc['peak_kib']:>8.1f} KiB/request, retained {alloc['retained_kib']:>6.1f} KiB/request")
+
+
+def compare(results, baseline, tolerance):
+    """Returns the p95 regressions beyond `tolerance` (a fraction) versus a saved run.
+
+    Runs saved before scenarios existed only measured the base scenario.
+    """
+    regressions = []
+    previous = {(load.get('scenario', 'base'), load['concurrency']): load for load in baseline['load']}
+    for load in results['load']:
+        scenario = load.get('scenario', 'base')
+        before = previous.get((scenario, load['concurrency']))
+        for kind in ('dine-in', 'stripe'):
+            if not before or kind not in load or kind not in before:
+                continue
+            old, new = before[kind]['p95'], load[kind]['p95']
+            if old and new > old * (1 + tolerance):
+                regressions.append(f"p95 {kind} ({scenario}) @ {load['concurrency']} threads: {old:.1f} -> {new:.1f} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test lambda_handler against local fakes.")
+    parser.add_argument('--requests', type=int, default=400, help="Requests per concurrency level")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--stripe-share', type=float, default=0.5, help="Fraction of requests that are Stripe webhooks")
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--no-latency', action='store_true', help="Fakes answer instantly (CPU cost only)")
+    parser.add_argument('--cold-samples', type=int, default=5)
+    parser.add_argument('--alloc-requests', type=int, default=100)
+    parser.add_argument('--save', help="Write the results to this JSON file")
+    parser.add_argument('--compare', help="Fail if p95 regresses against this saved JSON file")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p95 increase for --compare (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    latency = {name: 0.0 for name in LATENCY} if args.no_latency else dict(LATENCY)
+    import lambda_function
+    results = {'latency': latency, 'load': [], 'cold': {}, 'allocations': {}}
+    # EMF metric lines go to stdout in the handler; keep them out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        results['receipt_queue'] = check_receipt_queue(lambda_function)
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                fakes = install(lambda_function, latency, scenario)
+                lambda_function._charge_cache.clear()
+                events = build_events(args.requests, args.stripe_share, fakes['stripe'], seed=concurrency)
+                invoke(lambda_function, *events[0], 'warmup') # The first request pays one-off setup
+                load = {'scenario': scenario, **run_load(lambda_function, events[1:], concurrency)}
+                if scenario == 'rollups':
+                    load['stream'] = measure_stream(lambda_function, fakes['orders_table'])
+                results['load'].append(load)
+
+        fakes = install(lambda_function, {name: 0.0 for name in LATENCY})
+        results['allocations'] = measure_allocations(
+            lambda_function, build_events(args.alloc_requests, args.stripe_share, fakes['stripe'], seed=99))
+    for kind, scenario in COLD_PATHS:
+        if scenario in args.scenarios:
+            results['cold'][f"{kind}/{scenario}"] = measure_cold(kind, scenario, args.cold_samples, latency)
+
+    print_report(results)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark: compact print_codec payloads vs the current JSON print job.
+
+Reports payload size and encode/decode time for print jobs of several sizes.
+
+    python benchmarks/bench_print_codec.py [iterations]
+"""
+import os
+import sys
+import json
+import time
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from print_codec import decode_print_job, encode_print_job  # noqa: E402
+
+MENU = ['Salmon Nigiri', 'Dragon Roll', 'Chicken Teriyaki', 'Miso Soup', 'Spicy Tuna Roll', 'Edamame']
+
+
+def make_print_job(n_items):
+    """Shaped like process_order's order_for_mqtt, including the trace context."""
+    return {
+        'orderId': 'ord-20261016-0042',
+        'customerName': 'Test Guest',
+        'notes': 'Allergic to sesame',
+        'orderType': 'dine-in',
+        'items': [
+            {
+                'name': MENU[i % len(MENU)],
+                'quantity': 1 + i % 3,
+                'finalPrice': Decimal('12.50'),
+                'options': 'Spicy; Extra ginger' if i % 2 else '',
+                'location': 'front' if i % 3 else 'back',
+            }
+            for i in range(n_items)
+        ],
+        'orderDate': '2026-10-16T18:42:10+00:00',
+        'total': 12.5 * n_items,
+        'table': 'table-7',
+        'order_id': 'ord-20261016-0042',
+        'trace': {'ingest_ts': time.time(), 'request_id': 'b1c2d3', 'steps': {'parse_ms': 0.2, 'normalise_ms': 0.4},
+                  'order_id': 'ord-20261016-0042', 'publish_ts': time.time()},
+    }
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print(f"{'items':>5} {'json B':>8} {'compact B':>10} {'ratio':>6} "
+          f"{'json enc us':>12} {'cmp enc us':>11} {'json dec us':>12} {'cmp dec us':>11}")
+    for n_items in (3, 15, 60):
+        job = make_print_job(n_items)
+        as_json = json.dumps(job, default=str)
+        compact = encode_print_job(job)
+        assert decode_print_job(compact)['items'][0]['finalPrice'] == Decimal('12.50')
+
+        def per_call(fn):
+            return timeit.timeit(fn, number=iterations) / iterations * 1e6
+
+        json_enc = per_call(lambda: json.dumps(job, default=str))
+        compact_enc = per_call(lambda: encode_print_job(job))
+        json_dec = per_call(lambda: json.loads(as_json))
+        compact_dec = per_call(lambda: decode_print_job(compact))
+        print(f"{n_items:>5} {len(as_json):>8} {len(compact):>10} {len(compact) / len(as_json):>6.2f} "
+              f"{json_enc:>12.1f} {compact_enc:>11.1f} {json_dec:>12.1f} {compact_dec:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
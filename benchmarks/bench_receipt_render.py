@@ -0,0 +1,139 @@
+"""Throughput benchmark: receipt rendering before and after the fragment caches.
+
+Renders a batch of takeout receipts (as a bulk re-send after an SES outage
+would) with the old per-receipt code from send_receipt_email and with
+receipt_renderer.render_receipts, and checks both produce identical HTML.
+
+    python benchmarks/bench_receipt_render.py [receipts] [rounds]
+"""
+import os
+import sys
+import time
+import random
+from datetime import datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-function'))
+
+from receipt_renderer import item_row_html, receipt_date_text, render_receipts  # noqa: E402
+from receipt_template import get_receipt_template  # noqa: E402
+
+MENU = [('Dragon Roll', '14.95'), ('Salmon Nigiri', '6.50'), ('Chicken Teriyaki', '16.25'),
+        ('Miso Soup', '3.25'), ('Edamame', '4.95'), ('Spicy Tuna Roll', '9.75'), ('Green Tea', '2.50')]
+CARDS = [{'brand': 'visa', 'last4': '4242', 'wallet': None}, {'brand': 'mastercard', 'last4': '4444', 'wallet': None},
+         {'brand': 'amex', 'last4': '0005', 'wallet': None}, {'brand': 'discover', 'last4': '1117', 'wallet': None},
+         {'brand': 'visa', 'last4': '1881', 'wallet': {'type': 'apple_pay'}}]
+
+
+def make_jobs(n, seed=3):
+    rng = random.Random(seed)
+    jobs = []
+    for i in range(n):
+        items = [{'name': name, 'quantity': rng.randint(1, 3), 'finalPrice': Decimal(price)}
+                 for name, price in rng.sample(MENU, rng.randint(1, 6))]
+        subtotal = sum(item['finalPrice'] * item['quantity'] for item in items)
+        order_details = {
+            'orderId': f"T{i:06d}",
+            'total': (subtotal * Decimal('1.13')).quantize(Decimal('0.01')),
+            'notes': '',
+            'paidAt_iso': f"2026-10-{1 + i % 16:02d}T18:{i % 60:02d}:00+00:00",
+            'subtotalCents': subtotal * 100,
+            'taxTotalCents': (subtotal * 13).quantize(Decimal('1')),
+        }
+        jobs.append((order_details, {'type': 'card', 'card': rng.choice(CARDS)}, items))
+    return jobs
+
+
+def render_receipt_old(order_details, payment_details, items_list):
+    """The rendering half of send_receipt_email before receipt_renderer existed."""
+    receipt_template = get_receipt_template()
+    total_decimal = order_details.get('total', Decimal('0.00'))
+    amount_text = f"CA${total_decimal:.2f}"
+    date_text = "N/A"
+    paid_at_iso = order_details.get('paidAt_iso')
+    if paid_at_iso:
+        date_text = datetime.fromisoformat(paid_at_iso.replace('Z', '+00:00')).strftime('%b %d, %Y')
+
+    chips_html = ''
+    card_details = payment_details.get('card', {})
+    brand = str(card_details.get('brand', 'card')).lower()
+    last4 = card_details.get('last4', '')
+    wallet = card_details.get('wallet')
+    if wallet:
+        wallet_type = str(wallet.get('type') if isinstance(wallet, dict) else wallet).lower()
+        if 'apple_pay' in wallet_type:
+            chips_html = '<div style="display: inline-block; border-radius: 9999px; background-color: #000000; padding: 4px 10px; font-size: 12px; font-weight: 500; color: #ffffff;">Apple Pay</div>'
+    else:
+        if brand == 'visa':
+            chips_html = f'<div style="display: inline-block; border-radius: 9999px; background-color: #2563eb; padding: 4px 10px; font-size: 12px; font-weight: 500; color: #ffffff;">VISA •••• {last4}</div>'
+        elif brand == 'mastercard':
+            chips_html = f'<div style="display: inline-block; border-radius: 9999px; background-color: #ea580c; padding: 4px 10px; font-size: 12px; font-weight: 500; color: #ffffff;">Mastercard •••• {last4}</div>'
+        elif brand == 'amex':
+            chips_html = f'<div style="display: inline-block; border-radius: 9999px; background-color: #0284c7; padding: 4px 10px; font-size: 12px; font-weight: 500; color: #ffffff;">AMEX •••• {last4}</div>'
+        else:
+            chips_html = f'<div style="display: inline-block; border-radius: 9999px; background-color: #334155; padding: 4px 10px; font-size: 12px; font-weight: 500; color: #ffffff;">Card •••• {last4}</div>'
+
+    items_html_rows = []
+    for item in items_list:
+        quantity = item.get('quantity', 1)
+        name = item.get('name')
+        if not name:
+            name = item.get('menuItem', {}).get('name', 'Item')
+        price = Decimal(str(item.get('finalPrice', '0.00')))
+        items_html_rows.append(f"""
+                <tr>
+                    <td style="padding: 8px 0; font-size: 14px; color: #0f172a;">{quantity}x {name}</td>
+                    <td style="padding: 8px 0; font-size: 14px; color: #0f172a; text-align: right;">CA${price:.2f}</td>
+                </tr>
+            """)
+    subtotal_val = order_details.get('subtotalCents')
+    subtotal = Decimal(subtotal_val) / 100 if subtotal_val is not None else Decimal('0.00')
+    tax_val = order_details.get('taxTotalCents')
+    tax = Decimal(tax_val) / 100 if tax_val is not None else Decimal('0.00')
+    return receipt_template.render({
+        'RECEIPT_ID': str(order_details.get('orderId', 'N/A')),
+        'ITEMS_LIST': ''.join(items_html_rows),
+        'AMOUNT': amount_text,
+        'DATE': date_text,
+        'PAYMENT_METHOD_CHIPS': chips_html,
+        'SUBTOTAL': f'CA${subtotal:.2f}',
+        'TAX': f'CA${tax:.2f}',
+    })
+
+
+def best_of(rounds, fn):
+    best = float('inf')
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    n_receipts = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    jobs = make_jobs(n_receipts)
+
+    old = [render_receipt_old(*job) for job in jobs]
+    assert render_receipts(jobs) == old, "receipt_renderer output differs from the old rendering"
+
+    def cold_batch():
+        item_row_html.cache_clear()
+        receipt_date_text.cache_clear()
+        render_receipts(jobs)
+
+    cases = [
+        ('old: per-receipt formatting', lambda: [render_receipt_old(*job) for job in jobs]),
+        ('render_receipts, cold caches', cold_batch),
+        ('render_receipts, warm caches', lambda: render_receipts(jobs)),
+    ]
+    print(f"{n_receipts} receipts, best of {rounds}")
+    for label, fn in cases:
+        seconds = best_of(rounds, fn)
+        print(f"  {label:<30} {seconds * 1000:8.1f} ms  {n_receipts / seconds:9.0f} receipts/s")
+    print(f"  row cache: {item_row_html.cache_info()}")
+
+
+if __name__ == '__main__':
+    main()
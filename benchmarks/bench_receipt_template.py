@@ -0,0 +1,65 @@
+"""Micro-benchmark: receipt rendering with chained str.replace vs CompiledTemplate.
+
+    python benchmarks/bench_receipt_template.py [iterations]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-function'))
+
+from receipt_template import TEMPLATE_PATH, CompiledTemplate  # noqa: E402
+
+VALUES = {
+    'RECEIPT_ID': 'pi_3Q0bench000001',
+    'ITEMS_LIST': ''.join(
+        f'<tr><td style="padding: 8px 0;">2x Salmon Roll {i}</td>'
+        f'<td style="padding: 8px 0; text-align: right;">CA$12.50</td></tr>'
+        for i in range(8)
+    ),
+    'AMOUNT': 'CA$113.00',
+    'DATE': 'Oct 16, 2026',
+    'PAYMENT_METHOD_CHIPS': '<div style="display: inline-block;">VISA •••• 4242</div>',
+    'SUBTOTAL': 'CA$100.00',
+    'TAX': 'CA$13.00',
+}
+
+
+def render_with_replace(template, values):
+    """The pre-compiled-template implementation: one full pass per placeholder."""
+    html_body = template
+    html_body = html_body.replace('__RECEIPT_ID_PLACEHOLDER__', values['RECEIPT_ID'])
+    html_body = html_body.replace('__ITEMS_LIST_PLACEHOLDER__', values['ITEMS_LIST'])
+    html_body = html_body.replace('__AMOUNT_PLACEHOLDER__', values['AMOUNT'])
+    html_body = html_body.replace('__DATE_PLACEHOLDER__', values['DATE'])
+    html_body = html_body.replace('__PAYMENT_METHOD_CHIPS_PLACEHOLDER__', values['PAYMENT_METHOD_CHIPS'])
+    html_body = html_body.replace('__SUBTOTAL_PLACEHOLDER__', values['SUBTOTAL'])
+    html_body = html_body.replace('__TAX_PLACEHOLDER__', values['TAX'])
+    return html_body
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    def read_and_replace():
+        with open(TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+            return render_with_replace(f.read(), VALUES)
+
+    with open(TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+        source = f.read()
+    compiled = CompiledTemplate(source)
+    assert compiled.render(VALUES) == render_with_replace(source, VALUES)
+
+    cases = [
+        ('old: read file + 7x str.replace', read_and_replace),
+        ('cached source + 7x str.replace', lambda: render_with_replace(source, VALUES)),
+        ('new: CompiledTemplate.render', lambda: compiled.render(VALUES)),
+    ]
+    print(f"template: {len(source)} chars, {len(compiled.placeholders)} placeholders, {iterations} renders")
+    for label, fn in cases:
+        per_call = timeit.timeit(fn, number=iterations) / iterations
+        print(f"  {label:<34} {per_call * 1e6:8.2f} us/receipt")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Write-time rollups against the in-process DynamoDB stand-in.
+
+Sends dine-in orders through lambda_handler from several threads, re-delivers
+a share of them and bulk-loads more with bulk_ingest.py. The orders table's
+stream is then fed to lambda_handler's stream consumer, with one batch
+delivered twice like a retried stream batch, and the dashboard read (one
+Query) is checked against totals recomputed from the orders table.
+
+    python benchmarks/bench_rollups.py [orders] [threads]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import contextlib
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DYNAMODB_TABLE_NAME', 'bench-orders')
+os.environ.setdefault('ROLLUP_TABLE_NAME', 'bench-rollups')
+os.environ.setdefault('PRINTER_TOPIC', 'printers/orders/print')
+os.environ.setdefault('DASHBOARD_TOKEN', 'bench-token')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-function'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import lambda_function  # noqa: E402
+from bulk_ingest import ingest_orders  # noqa: E402
+from fakes import FakeIotData, FakeTable, install_fakes  # noqa: E402
+
+MENU = [('Dragon Roll', '14.95'), ('Salmon Nigiri', '6.50'), ('Miso Soup', '3.25'), ('Edamame', '4.95')]
+
+
+def make_order(i):
+    items = []
+    for name, price in random.sample(MENU, random.randint(1, len(MENU))):
+        quantity = random.randint(1, 3)
+        items.append({'name': name, 'price': float(price), 'quantity': quantity,
+                      'subtotal': float(Decimal(price) * quantity), 'location': 'front'})
+    total = sum(Decimal(str(item['subtotal'])) for item in items)
+    return {'order_id': f'R{i:05d}', 'orderType': 'dine-in', 'table': f'table-{i % 12}',
+            'items': items, 'total': float(total), 'notes': ''}
+
+
+def send(order):
+    return lambda_function.lambda_handler({'httpMethod': 'POST', 'headers': {}, 'body': json.dumps(order)}, None)
+
+
+def main():
+    n_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    random.seed(7)
+    orders_table = FakeTable('orderId', name='bench-orders')
+    rollup_table = FakeTable(('pk', 'sk'), name='bench-rollups')
+    install_fakes(lambda_function, orders_table=orders_table, rollup_table=rollup_table, iot_data=FakeIotData())
+
+    orders = [make_order(i) for i in range(n_orders)]
+    redeliveries = random.sample(orders, n_orders // 5)  # Stripe/client retries of the same order_id
+    backfill = [make_order(i) for i in range(n_orders, n_orders + n_orders // 4)]
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(threads) as pool:
+        statuses = list(pool.map(lambda order: send(order)['statusCode'], orders + redeliveries))
+    elapsed = time.perf_counter() - started
+    assert set(statuses) == {200}, statuses
+    assert not rollup_table.items, "rollups must not be written on the request path"
+    with contextlib.redirect_stdout(io.StringIO()):
+        ingest_orders([dict(order) for order in backfill], table=orders_table, chunk_size=50)
+
+    stream_records = len(orders_table.stream)
+    batches = 0
+    stream_started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        while orders_table.stream:
+            event = orders_table.drain_stream_event()
+            for _ in range(2 if batches == 0 else 1):  # The first batch is retried by the "stream"
+                assert lambda_function.lambda_handler(event, None) == {'batchItemFailures': []}
+            batches += 1
+    stream_elapsed = time.perf_counter() - stream_started
+
+    response = lambda_function.lambda_handler({
+        'httpMethod': 'GET',
+        'headers': {'Authorization': f"Bearer {os.environ['DASHBOARD_TOKEN']}"},
+        'queryStringParameters': {'day': lambda_function.business_today(lambda_function.BUSINESS_TIMEZONE)},
+    }, None)
+    dashboard = json.loads(response['body'])
+
+    saved = orders_table.scan()['Items']
+    expected_revenue = float(sum(order['total'] for order in saved))
+    expected_quantity = {}
+    for order in saved:
+        for item in order['items']:
+            expected_quantity[item['name']] = expected_quantity.get(item['name'], 0) + int(item['quantity'])
+
+    assert dashboard['orders'] == len(saved) == n_orders + len(backfill), (dashboard['orders'], len(saved))
+    assert abs(dashboard['revenue'] - expected_revenue) < 0.005, (dashboard['revenue'], expected_revenue)
+    assert {i['name']: i['quantity'] for i in dashboard['items']} == expected_quantity
+    assert sum(h['orders'] for h in dashboard['hours']) == len(saved)
+
+    print(f"{len(orders) + len(redeliveries)} requests ({len(redeliveries)} re-deliveries) on {threads} threads "
+          f"in {elapsed:.2f}s, {len(backfill)} more bulk-ingested")
+    print(f"stream: {stream_records} records in {batches} batches (first one delivered twice) in {stream_elapsed:.2f}s, "
+          f"{rollup_table.meta.client.transactions} rollup transactions")
+    print(f"dashboard: {dashboard['orders']} orders, ${dashboard['revenue']:.2f}, "
+          f"{len(dashboard['items'])} items, {len(rollup_table.items)} rollup rows - matches the orders table")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Micro-benchmark: rendering a kitchen ticket into one ESC/POS buffer.
+
+    python benchmarks/bench_ticket_render.py [items] [iterations]
+
+Also times the same ticket with cached raster headers when Pillow is
+installed (it comes with python-escpos).
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ticket_renderer import render_ticket  # noqa: E402
+
+
+def sample_order(n_items):
+    return {
+        'order_id': 'bench-0001',
+        'orderType': 'dine-in',
+        'table': 'table-12',
+        'notes': 'No wasabi on the nigiri please',
+        'items': [
+            {'name': f'Salmon Roll {i}', 'quantity': 2, 'options': 'Spicy; Extra ginger'}
+            for i in range(n_items)
+        ],
+    }
+
+
+def main():
+    n_items = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    order = sample_order(n_items)
+
+    cases = [('text headers', None)]
+    try:
+        from ticket_images import HeaderRasterCache, TicketBranding
+        cases.append(('cached raster headers', TicketBranding(headers=HeaderRasterCache())))
+    except ImportError:
+        print("Pillow not installed; skipping the raster header case")
+
+    print(f"{n_items} items, {iterations} renders")
+    for label, branding in cases:
+        ticket = render_ticket(order, branding=branding)
+        per_ticket = timeit.timeit(lambda: render_ticket(order, branding=branding), number=iterations) / iterations
+        print(f"  {label:<22} {len(ticket):6d} bytes  {per_ticket * 1e6:8.1f} us/ticket")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""In-process stand-ins for the external services lambda_function talks to.
+
+Install them with install_fakes(lambda_function, ...) - they are dropped into
+the lazy client cache, so the real boto3/stripe clients are never created.
+"""
+import copy
+import hmac
+import json
+import time
+import hashlib
+import threading
+from types import SimpleNamespace
+from decimal import Decimal
+
+
+def sign_webhook(payload, secret, timestamp=None):
+    """Builds a Stripe-Signature header the way Stripe signs webhook payloads."""
+    timestamp = int(timestamp or time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+class FakeStripe:
+    """Stand-in for the `stripe` module: Webhook.construct_event and Charge.retrieve."""
+
+    class SignatureVerificationError(Exception):
+        pass
+
+    def __init__(self, charges=None, latency=0.0):
+        self.charges = dict(charges or {})
+        self.latency = latency
+        self.retrieve_calls = []
+        self.Webhook = _FakeWebhook(self)
+        self.Charge = _FakeCharge(self)
+
+
+class _FakeWebhook:
+    def __init__(self, stripe):
+        self._stripe = stripe
+
+    def construct_event(self, payload, sig_header, secret, tolerance=300):
+        parts = dict(item.split('=', 1) for item in sig_header.split(','))
+        expected = sign_webhook(payload, secret, timestamp=parts.get('t', 0)).split('v1=')[1]
+        if not hmac.compare_digest(expected, parts.get('v1', '')):
+            raise self._stripe.SignatureVerificationError("No signatures found matching the expected signature")
+        if abs(time.time() - int(parts['t'])) > tolerance:
+            raise self._stripe.SignatureVerificationError("Timestamp outside the tolerance zone")
+        return json.loads(payload)
+
+
+class _FakeCharge:
+    def __init__(self, stripe):
+        self._stripe = stripe
+
+    def retrieve(self, charge_id, **params):
+        self._stripe.retrieve_calls.append(charge_id)
+        if self._stripe.latency:
+            time.sleep(self._stripe.latency)
+        if charge_id not in self._stripe.charges:
+            raise LookupError(f"No such charge: '{charge_id}'")
+        return self._stripe.charges[charge_id]
+
+
+def make_charge(charge_id, email='guest@example.com', name='Test Guest', brand='visa', last4='4242'):
+    return {
+        'id': charge_id,
+        'object': 'charge',
+        'billing_details': {'email': email, 'name': name},
+        'payment_method_details': {'type': 'card', 'card': {'brand': brand, 'last4': last4, 'wallet': None}},
+    }
+
+
+class FakeIotData:
+    """Stand-in for the iot-data client; records every publish."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.published = []
+        self._lock = threading.Lock()
+
+    def publish(self, topic, qos=0, payload=b'', **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.published.append({'topic': topic, 'qos': qos, 'payload': payload, **kwargs})
+        return {}
+
+
+class FakeSes:
+    """Stand-in for the SES client; records every send_email."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send_email(self, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.sent.append(kwargs)
+            return {'MessageId': f"fake-{len(self.sent)}"}
+
+
+def to_stream_image(item):
+    """A plain item as the DynamoDB-JSON NewImage of a stream record."""
+    def value(v):
+        if v is None:
+            return {'NULL': True}
+        if isinstance(v, bool):
+            return {'BOOL': v}
+        if isinstance(v, (int, float, Decimal)):
+            return {'N': str(v)}
+        if isinstance(v, dict):
+            return {'M': {k: value(x) for k, x in v.items()}}
+        if isinstance(v, (list, tuple)):
+            return {'L': [value(x) for x in v]}
+        return {'S': str(v)}
+    return {k: value(v) for k, v in item.items()}
+
+
+class TransactionCanceledException(Exception):
+    def __init__(self, reasons):
+        super().__init__(f"Transaction cancelled, please refer cancellation reasons for specific reasons {reasons}")
+        self.response = {'Error': {'Code': 'TransactionCanceledException'}, 'CancellationReasons': reasons}
+
+
+class _FakeDynamoClient:
+    """table.meta.client: transact_write_items against the tables it knows by name."""
+
+    exceptions = SimpleNamespace(TransactionCanceledException=TransactionCanceledException)
+
+    def __init__(self, table):
+        self.tables = {table.name: table}
+        self.transactions = 0
+
+    def transact_write_items(self, TransactItems):
+        if len(TransactItems) > 100:
+            raise ValueError("Member must have length less than or equal to 100")
+        tables = [self.tables[next(iter(action.values()))['TableName']] for action in TransactItems]
+        tables[0]._round_trip()
+        with tables[0]._lock: # One table per transaction is all the Lambda needs
+            reasons = []
+            for table, action in zip(tables, TransactItems):
+                put = action.get('Put')
+                failed = (put is not None and put.get('ConditionExpression', '').startswith('attribute_not_exists')
+                          and table._key(put['Item']) in table.items)
+                reasons.append({'Code': 'ConditionalCheckFailed' if failed else 'None'})
+            if any(reason['Code'] != 'None' for reason in reasons):
+                raise TransactionCanceledException(reasons)
+            for table, action in zip(tables, TransactItems):
+                if 'Put' in action:
+                    table._store(action['Put']['Item'])
+                else:
+                    update = action['Update']
+                    table._add(update['Key'], update['UpdateExpression'], update['ExpressionAttributeValues'],
+                               update.get('ExpressionAttributeNames'))
+            self.transactions += 1
+        return {}
+
+
+class FakeTable:
+    """Dict-backed stand-in for a boto3 DynamoDB Table resource.
+
+    `key` is the partition key name, or a (partition, sort) tuple. Only the
+    expression forms the Lambda uses are understood: `ADD` update expressions,
+    a `#pk = :pk` key condition and, in meta.client.transact_write_items, an
+    `attribute_not_exists` condition on a Put.
+
+    batch_writer() flushes in groups of 25 like BatchWriteItem; set
+    `unprocessed_every` to have every Nth flush hand its last item back as
+    unprocessed, to exercise the retry path. `latency` seconds are slept on
+    every single-item call, like a DynamoDB round trip.
+
+    Every write is also recorded as a stream record (INSERT or MODIFY, with
+    the NewImage); drain_stream_event() hands them out like a DynamoDB
+    stream batch.
+    """
+
+    def __init__(self, key='orderId', unprocessed_every=0, latency=0.0, name='fake-table'):
+        self.key = key
+        self.name = name
+        self.latency = latency
+        self.key_names = key if isinstance(key, tuple) else (key,)
+        self.items = {}
+        self.stream = []
+        self.batch_requests = 0
+        self.unprocessed_every = unprocessed_every
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self.meta = SimpleNamespace(client=_FakeDynamoClient(self))
+
+    def _key(self, item):
+        values = tuple(item[name] for name in self.key_names)
+        return values if len(values) > 1 else values[0]
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _store(self, item):
+        """Writes `item` and records its stream record; call with the lock held."""
+        key = self._key(item)
+        old = self.items.get(key)
+        self.items[key] = copy.deepcopy(item)
+        self._sequence += 1
+        self.stream.append({
+            'eventID': f"fake-{self._sequence}",
+            'eventName': 'INSERT' if old is None else 'MODIFY',
+            'eventSource': 'aws:dynamodb',
+            'dynamodb': {'NewImage': to_stream_image(item), 'SequenceNumber': str(self._sequence)},
+        })
+        return old
+
+    def drain_stream_event(self, batch_size=100):
+        """Pops up to `batch_size` stream records wrapped like a DynamoDB stream Lambda event."""
+        with self._lock:
+            batch, self.stream = self.stream[:batch_size], self.stream[batch_size:]
+        return {'Records': batch}
+
+    def put_item(self, Item, **kwargs):
+        self._round_trip()
+        with self._lock:
+            old = self._store(Item)
+        if kwargs.get('ReturnValues') == 'ALL_OLD' and old is not None:
+            return {'Attributes': old}
+        return {}
+
+    def get_item(self, Key, **kwargs):
+        self._round_trip()
+        with self._lock:
+            item = self.items.get(self._key(Key))
+        return {'Item': copy.deepcopy(item)} if item is not None else {}
+
+    def _add(self, key, expression, values, names=None):
+        """Applies an `ADD` update expression; call with the lock held."""
+        action, _, clauses = expression.strip().partition(' ')
+        if action.upper() != 'ADD':
+            raise NotImplementedError(f"FakeTable only supports ADD updates, got {expression!r}")
+        names = names or {}
+        item = self.items.setdefault(self._key(key), copy.deepcopy(key))
+        for clause in clauses.split(','):
+            name, placeholder = clause.split()
+            name = names.get(name, name)
+            item[name] = item.get(name, 0) + Decimal(values[placeholder])
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues, ExpressionAttributeNames=None, **kwargs):
+        self._round_trip()
+        with self._lock:
+            self._add(Key, UpdateExpression, ExpressionAttributeValues, ExpressionAttributeNames)
+        return {}
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues, ExpressionAttributeNames=None, **kwargs):
+        name, _, placeholder = KeyConditionExpression.split()
+        name = (ExpressionAttributeNames or {}).get(name, name)
+        value = ExpressionAttributeValues[placeholder]
+        self._round_trip()
+        with self._lock:
+            rows = [copy.deepcopy(item) for item in self.items.values() if item.get(name) == value]
+        if len(self.key_names) > 1:
+            rows.sort(key=lambda item: item[self.key_names[1]])
+        return {'Items': rows, 'Count': len(rows)}
+
+    def scan(self, **kwargs):
+        with self._lock:
+            return {'Items': [copy.deepcopy(item) for item in self.items.values()]}
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return _FakeBatchWriter(self, overwrite_by_pkeys)
+
+
+class _FakeBatchWriter:
+    def __init__(self, table, overwrite_by_pkeys):
+        self._table = table
+        self._overwrite_by_pkeys = overwrite_by_pkeys
+        self._buffer = []
+
+    def put_item(self, Item):
+        if self._overwrite_by_pkeys:
+            keys = [Item[k] for k in self._overwrite_by_pkeys]
+            self._buffer = [i for i in self._buffer if [i[k] for k in self._overwrite_by_pkeys] != keys]
+        self._buffer.append(Item)
+        if len(self._buffer) >= 25:
+            self._flush()
+
+    def _flush(self):
+        batch, self._buffer = self._buffer[:25], self._buffer[25:]
+        self._table.batch_requests += 1
+        every = self._table.unprocessed_every
+        if every and self._table.batch_requests % every == 0 and len(batch) > 1:
+            self._buffer.append(batch.pop())  # Returned as UnprocessedItems, retried later
+        self._table._round_trip()
+        with self._table._lock:
+            for item in batch:
+                self._table._store(item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        while self._buffer:
+            self._flush()
+
+
+def install_fakes(lambda_function, stripe=None, orders_table=None, rollup_table=None, iot_data=None, ses=None,
+                  receipt_queue=None):
+    """Points lambda_function's lazy clients at the given fakes.
+
+    `receipt_queue` (e.g. receipt_queue.InMemoryReceiptQueue) also turns on
+    receipt queueing, which lambda_function only does when RECEIPT_QUEUE_URL
+    is set.
+    """
+    if stripe is not None:
+        lambda_function._clients['stripe'] = stripe
+    if ses is not None:
+        lambda_function._clients['ses'] = ses
+    if iot_data is not None:
+        lambda_function._clients['iot-data'] = iot_data
+    if orders_table is not None:
+        lambda_function._clients['orders_table'] = orders_table
+    if rollup_table is not None:
+        lambda_function._clients['rollup_table'] = rollup_table
+    if receipt_queue is not None:
+        lambda_function.RECEIPT_QUEUE_URL = lambda_function.RECEIPT_QUEUE_URL or 'local://receipt-queue'
+        lambda_function._clients['receipt_queue'] = receipt_queue
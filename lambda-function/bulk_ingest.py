@@ -0,0 +1,163 @@
+"""Bulk order ingestion for replays and backfills.
+
+Takes a stream of order payloads - the same dicts process_order receives, or
+raw `payment_intent.succeeded` Stripe events - normalises each one with
+build_order_record and writes them with DynamoDB batch_writer instead of one
+put_item per order. Stripe events whose charge isn't embedded need a
+Charge.retrieve each; those lookups run concurrently within a chunk. Only the
+orders table is written: nothing is printed and no receipts are sent.
+Dashboard rollups follow from the orders table's stream, as for orders saved
+by lambda_handler.
+
+    python bulk_ingest.py orders.jsonl [--chunk-size 500] [--stripe-workers 8]
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+
+from lambda_function import (
+    build_order_record,
+    emit_metrics,
+    get_orders_table,
+    order_data_from_payment_intent,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_STRIPE_WORKERS = 8 # Concurrent Charge.retrieve calls, well under Stripe's rate limit
+
+
+def is_stripe_event(payload):
+    return payload.get('type') == 'payment_intent.succeeded'
+
+
+def to_order_data(payload):
+    """Accepts an order payload or a Stripe payment_intent.succeeded event."""
+    if is_stripe_event(payload):
+        return order_data_from_payment_intent(payload['data']['object'])[0]
+    return payload
+
+
+def _normalise(payload):
+    """(order record, None), or (None, error) if the payload can't be normalised."""
+    try:
+        return build_order_record(to_order_data(payload)), None
+    except Exception as e:
+        return None, e
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for entry in iterable:
+        chunk.append(entry)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def normalise_chunk(chunk, pool):
+    """_normalise results for a chunk, in order.
+
+    Stripe events go to `pool`, since each may wait on a Charge.retrieve;
+    plain payloads are normalised inline meanwhile. Returns (results, number
+    of Stripe events, seconds until the last of them was done).
+    """
+    started = time.perf_counter()
+    events = {i: pool.submit(_normalise, payload) for i, payload in enumerate(chunk) if is_stripe_event(payload)}
+    results = [None if i in events else _normalise(payload) for i, payload in enumerate(chunk)]
+    for i, future in events.items():
+        results[i] = future.result()
+    return results, len(events), (time.perf_counter() - started) if events else 0.0
+
+
+def ingest_orders(payloads, table=None, chunk_size=DEFAULT_CHUNK_SIZE, stripe_workers=DEFAULT_STRIPE_WORKERS):
+    """Writes every payload to the orders table; returns throughput stats.
+
+    Each chunk is written in its own batch_writer, which splits it into
+    25-item BatchWriteItem calls and re-sends any UnprocessedItems. Duplicate
+    orderIds are only collapsed when they land in the same 25-item buffer;
+    otherwise the later write overwrites the earlier one. Either way the last
+    payload wins, matching put_item. Payloads that can't be normalised are
+    logged and skipped.
+    """
+    table = table or get_orders_table()
+    if table is None:
+        raise RuntimeError("DYNAMODB_TABLE_NAME is not set - nowhere to write orders")
+
+    stats = {'written': 0, 'skipped': 0, 'chunks': 0, 'stripe_events': 0, 'stripe_seconds': 0.0}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=stripe_workers, thread_name_prefix='stripe') as pool:
+        for chunk in _chunks(payloads, chunk_size):
+            results, stripe_events, stripe_seconds = normalise_chunk(chunk, pool)
+            records = []
+            for record, error in results:
+                if error is not None:
+                    logger.warning(f"Skipping order that could not be normalised: {error}")
+                    stats['skipped'] += 1
+                    continue
+                if not record.get('orderId'):
+                    logger.warning("Skipping order without an order_id")
+                    stats['skipped'] += 1
+                    continue
+                records.append(record)
+
+            chunk_started = time.perf_counter()
+            with table.batch_writer(overwrite_by_pkeys=['orderId']) as batch:
+                for record in records:
+                    batch.put_item(Item=record)
+            chunk_seconds = time.perf_counter() - chunk_started
+
+            stats['written'] += len(records)
+            stats['chunks'] += 1
+            stats['stripe_events'] += stripe_events
+            stats['stripe_seconds'] += stripe_seconds
+            logger.info(
+                f"Chunk {stats['chunks']}: {stripe_events} Stripe events normalised in {stripe_seconds:.2f}s, "
+                f"wrote {len(records)} orders in {chunk_seconds:.2f}s "
+                f"({len(records) / chunk_seconds if chunk_seconds else 0:.0f}/s), {stats['written']} total"
+            )
+
+    stats['seconds'] = time.perf_counter() - started
+    stats['orders_per_second'] = stats['written'] / stats['seconds'] if stats['seconds'] else 0.0
+    emit_metrics({'OrdersIngested': stats['written'], 'OrdersSkipped': stats['skipped']}, unit='Count')
+    emit_metrics({'IngestThroughput': stats['orders_per_second']}, unit='Count/Second')
+    return stats
+
+
+def read_jsonl(lines):
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line, parse_float=Decimal)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Line {line_number}: invalid JSON ({e}), skipped")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load orders into the DynamoDB orders table.")
+    parser.add_argument('path', help="JSON-lines file of order payloads or Stripe events ('-' for stdin)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--stripe-workers', type=int, default=DEFAULT_STRIPE_WORKERS,
+                        help="Concurrent Charge.retrieve calls for Stripe events without an embedded charge")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.path == '-':
+        stats = ingest_orders(read_jsonl(sys.stdin), chunk_size=args.chunk_size, stripe_workers=args.stripe_workers)
+    else:
+        with open(args.path, 'r', encoding='utf-8') as f:
+            stats = ingest_orders(read_jsonl(f), chunk_size=args.chunk_size, stripe_workers=args.stripe_workers)
+    logger.info(f"Done: {stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,39 +1,137 @@
+import hmac
 import json
 import os
-import boto3
-import stripe
+import time
 import logging
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal, ROUND_HALF_UP
+from receipt_renderer import render_receipt
+from receipt_queue import SqsReceiptQueue, encode_receipt_job, decode_receipt_job
+from order_rollups import apply_order, business_today, is_transient, read_day, stream_new_image
 
 # --- Initialize Clients and Environment Variables ---
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
+STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
+STRIPE_TIMEOUT_SECONDS = float(os.environ.get('STRIPE_TIMEOUT_SECONDS', '3'))
+STRIPE_CHARGE_CACHE_TTL = float(os.environ.get('STRIPE_CHARGE_CACHE_TTL', '300'))
 webhook_secret = os.environ.get('STRIPE_WEBHOOK_SECRET')
 SENDER_EMAIL = os.environ.get('SENDER_EMAIL')
 
-# Initialize AWS clients
-ses_client = boto3.client('ses', region_name='ca-central-1')
-dynamodb = boto3.resource('dynamodb')
-iot_client = boto3.client('iot-data')
-
 # Get resources from environment variables
 DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME')
 PRINTER_TOPIC = os.environ.get('PRINTER_TOPIC')
-orders_table = dynamodb.Table(DYNAMODB_TABLE_NAME) if DYNAMODB_TABLE_NAME else None
+
+# Write-time sales counters for the dashboard (see order_rollups.py), applied
+# by the consumer of the orders table's stream. Days and hours are counted in
+# BUSINESS_TIMEZONE; the dashboard read route requires
+# `Authorization: Bearer <DASHBOARD_TOKEN>` and is disabled without it.
+ROLLUP_TABLE_NAME = os.environ.get('ROLLUP_TABLE_NAME')
+BUSINESS_TIMEZONE = os.environ.get('BUSINESS_TIMEZONE', 'UTC')
+DASHBOARD_TOKEN = os.environ.get('DASHBOARD_TOKEN')
+
+# 'json' (default) or 'compact' - the binary print job format from print_codec.py
+PRINT_PAYLOAD_FORMAT = os.environ.get('PRINT_PAYLOAD_FORMAT', 'json').lower()
+
+# When set, takeout receipts are queued here and sent by the SQS batch consumer
+# instead of synchronously inside the webhook request
+RECEIPT_QUEUE_URL = os.environ.get('RECEIPT_QUEUE_URL')
+
+# Run the DynamoDB save and the IoT publish concurrently for Stripe webhooks
+# (see process_order). The pool lives at module level so warm invocations
+# reuse its threads.
+PARALLEL_FANOUT = os.environ.get('PARALLEL_FANOUT', 'true').lower() == 'true'
+fanout_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='fanout')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'TableTap/OrderProcessing')
+
+# --- Lazy Clients ---
+# boto3, stripe and the AWS clients are created on first use and cached for
+# warm invocations, so a dine-in cold start never pays for Stripe or SES.
+# Creation is locked because the fan-out threads may ask for clients at once
+# and boto3's default session isn't thread-safe.
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _lazy_client(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+def _boto3():
+    import boto3
+    return boto3
+
+def _new_stripe():
+    import stripe
+    stripe.api_key = STRIPE_SECRET_KEY
+    # The webhook waits on this call, so keep it inside a fixed budget
+    stripe.default_http_client = stripe.RequestsClient(timeout=STRIPE_TIMEOUT_SECONDS)
+    stripe.max_network_retries = 0
+    return stripe
+
+def get_stripe():
+    return _lazy_client('stripe', _new_stripe)
+
+def get_ses_client():
+    return _lazy_client('ses', lambda: _boto3().client('ses', region_name='ca-central-1'))
+
+def get_iot_client():
+    return _lazy_client('iot-data', lambda: _boto3().client('iot-data'))
+
+def get_orders_table():
+    if not DYNAMODB_TABLE_NAME:
+        return None
+    return _lazy_client('orders_table', lambda: _boto3().resource('dynamodb').Table(DYNAMODB_TABLE_NAME))
+
+def get_rollup_table():
+    if not ROLLUP_TABLE_NAME:
+        return None
+    return _lazy_client('rollup_table', lambda: _boto3().resource('dynamodb').Table(ROLLUP_TABLE_NAME))
+
+def get_receipt_queue():
+    if not RECEIPT_QUEUE_URL:
+        return None
+    return _lazy_client('receipt_queue', lambda: SqsReceiptQueue(RECEIPT_QUEUE_URL, _boto3().client('sqs')))
 
 # --- Helper Functions ---
 def replace_floats_with_decimals(obj):
-    if isinstance(obj, list):
-        return [replace_floats_with_decimals(i) for i in obj]
-    elif isinstance(obj, dict):
-        return {k: replace_floats_with_decimals(v) for k, v in obj.items()}
-    elif isinstance(obj, float):
+    """Returns obj with every float converted to Decimal, in a single pass.
+
+    Dicts and lists that contain no floats are returned as-is rather than
+    rebuilt, so payloads already parsed with parse_float=Decimal cost one walk
+    and no copies.
+    """
+    if isinstance(obj, float):
         return Decimal(str(obj))
-    else:
-        return obj
+    if isinstance(obj, dict):
+        converted = None
+        for k, v in obj.items():
+            if isinstance(v, (float, dict, list)):
+                new_v = replace_floats_with_decimals(v)
+                if new_v is not v:
+                    if converted is None:
+                        converted = dict(obj)
+                    converted[k] = new_v
+        return obj if converted is None else converted
+    if isinstance(obj, list):
+        converted = None
+        for i, v in enumerate(obj):
+            if isinstance(v, (float, dict, list)):
+                new_v = replace_floats_with_decimals(v)
+                if new_v is not v:
+                    if converted is None:
+                        converted = list(obj)
+                    converted[i] = new_v
+        return obj if converted is None else converted
+    return obj
 
 def safe_decimal_from_metadata(value):
     if value is None or value == '':
@@ -44,6 +142,106 @@ def safe_decimal_from_metadata(value):
         logger.warning(f"Could not convert '{value}' to Decimal")
         return None
 
+def emit_metrics(values, unit='Milliseconds', **dimensions):
+    """Writes a CloudWatch Embedded Metric Format line; CloudWatch turns it into metrics."""
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': unit} for name in values],
+            }],
+        },
+        **dimensions,
+        **values,
+    }))
+
+def timed_step(fn, *args):
+    """Runs fn(*args) and returns (result, elapsed milliseconds)."""
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+# --- Trace Context ---
+# Carried in the MQTT payload as 'trace' so the listener can report the full
+# payment-to-paper breakdown. Timestamps are epoch seconds, steps are ms.
+def new_trace(context=None):
+    return {
+        'ingest_ts': time.time(),
+        'request_id': getattr(context, 'aws_request_id', None),
+        'steps': {},
+    }
+
+@contextmanager
+def trace_step(trace, name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace['steps'][name] = round((time.perf_counter() - started) * 1000, 1)
+
+# --- Stripe Charge Lookup ---
+# charge id -> (expires_at, (email, name, payment_method_details)). Lives for
+# the container, so webhook re-deliveries for the same payment skip Stripe.
+_charge_cache = {}
+CHARGE_CACHE_MAX_ENTRIES = 256
+
+def _charge_details(charge):
+    billing_details = charge.get('billing_details') or {}
+    return billing_details.get('email'), billing_details.get('name'), charge.get('payment_method_details') or {}
+
+def _embedded_charge(payment_intent, charge_id):
+    """Returns the charge object if the event already carries it, else None."""
+    latest_charge = payment_intent.get('latest_charge')
+    if isinstance(latest_charge, dict):  # Expanded in the event
+        return latest_charge
+    # Older API versions still embed the charge list on the PaymentIntent
+    for charge in (payment_intent.get('charges') or {}).get('data') or []:
+        if charge.get('id') == charge_id:
+            return charge
+    return None
+
+def get_charge_details(payment_intent):
+    """Returns (email, name, payment_method_details) for a PaymentIntent's latest charge.
+
+    Uses charge data already in the event when present; otherwise makes at most
+    one Charge.retrieve (bounded by STRIPE_TIMEOUT_SECONDS) and caches the result.
+    """
+    latest_charge = payment_intent.get('latest_charge')
+    if not latest_charge:
+        return None, None, {}
+    charge_id = latest_charge.get('id') if isinstance(latest_charge, dict) else latest_charge
+
+    charge = _embedded_charge(payment_intent, charge_id)
+    if charge is not None:
+        logger.info(f"Using charge {charge_id} embedded in the event")
+        return _charge_details(charge)
+
+    cached = _charge_cache.get(charge_id)
+    if cached and cached[0] > time.monotonic():
+        logger.info(f"Using cached charge {charge_id}")
+        return cached[1]
+
+    try:
+        charge, elapsed_ms = timed_step(get_stripe().Charge.retrieve, charge_id)
+        logger.info(f"Successfully retrieved Charge {charge_id} in {elapsed_ms:.0f} ms")
+    except Exception as e:
+        logger.error(f"Could not retrieve charge {charge_id}: {e}")
+        return None, None, {}
+
+    details = _charge_details(charge)
+    if len(_charge_cache) >= CHARGE_CACHE_MAX_ENTRIES:
+        now = time.monotonic()
+        # list(): bulk_ingest looks charges up from several threads
+        for key in [k for k, (expires_at, _) in list(_charge_cache.items()) if expires_at <= now]:
+            _charge_cache.pop(key, None)
+        if len(_charge_cache) >= CHARGE_CACHE_MAX_ENTRIES:
+            _charge_cache.clear()
+    _charge_cache[charge_id] = (time.monotonic() + STRIPE_CHARGE_CACHE_TTL, details)
+    return details
+
 # --- Email Sending Logic ---
 def send_receipt_email(recipient_email, order_details, payment_details, items_list):
     if not recipient_email:
@@ -55,95 +253,11 @@ def send_receipt_email(recipient_email, order_details, payment_details, items_li
         return False
 
     try:
-        # Load template (ensure this file exists in your Lambda deployment)
-        with open('emailtemplate.html', 'r', encoding='utf-8') as f:
-            html_template = f.read()
-
-        # --- SERVER-SIDE FORMATTING ---
-        
-        # 1. Format Amount
-        total_decimal = order_details.get('total', Decimal('0.00'))
-        amount_text = f"CA${total_decimal:.2f}"
-
-        # 2. Format Date
-        date_text = "N/A"
-        paid_at_iso = order_details.get('paidAt_iso')
-        if paid_at_iso:
-            try:
-                # Handle ISO format including Z for UTC
-                date_obj = datetime.fromisoformat(paid_at_iso.replace('Z', '+00:00'))
-                date_text = date_obj.strftime('%b %d, %Y')
-            except (ValueError, TypeError) as e:
-                logger.error(f"Could not parse date {paid_at_iso}: {e}")
-
-        # 3. Generate Payment Method Chips HTML
-        chips_html = ''
-        card_details = payment_details.get('card', {})
-        brand = str(card_details.get('brand', 'card')).lower()
-        last4 = card_details.get('last4', '')
-        wallet = card_details.get('wallet')
-        
-        # Determine chip color/text based on brand
-        if wallet:
-            wallet_type = str(wallet.get('type') if isinstance(wallet, dict) else wallet).lower()
-            if 'apple_pay' in wallet_type:
-                chips_html = '<div style="display: inline-block; border-radius: 9999px; background-color: #000000; padding: 4px 10px; font-size: 12px; font-weight: 500; color: #ffffff;">Apple Pay</div>'
-        else:
-            if brand == 'visa':
-                chips_html = f'<div style="display: inline-block; border-radius: 9999px; background-color: #2563eb; padding: 4px 10px; font-size: 12px; font-weight: 500; color: #ffffff;">VISA •••• {last4}</div>'
-            elif brand == 'mastercard':
-                chips_html = f'<div style="display: inline-block; border-radius: 9999px; background-color: #ea580c; padding: 4px 10px; font-size: 12px; font-weight: 500; color: #ffffff;">Mastercard •••• {last4}</div>'
-            elif brand == 'amex':
-                chips_html = f'<div style="display: inline-block; border-radius: 9999px; background-color: #0284c7; padding: 4px 10px; font-size: 12px; font-weight: 500; color: #ffffff;">AMEX •••• {last4}</div>'
-            else:
-                chips_html = f'<div style="display: inline-block; border-radius: 9999px; background-color: #334155; padding: 4px 10px; font-size: 12px; font-weight: 500; color: #ffffff;">Card •••• {last4}</div>'
-
-        # 4. Generate Itemized List HTML
-        items_html_rows = []
-        for item in items_list:
-            quantity = item.get('quantity', 1)
-            # Handle nested menuItem structure or flat structure
-            name = item.get('name')
-            if not name:
-                name = item.get('menuItem', {}).get('name', 'Item')
-            
-            price = Decimal(str(item.get('finalPrice', '0.00')))
-            
-            item_row_html = f"""
-                <tr>
-                    <td style="padding: 8px 0; font-size: 14px; color: #0f172a;">{quantity}x {name}</td>
-                    <td style="padding: 8px 0; font-size: 14px; color: #0f172a; text-align: right;">CA${price:.2f}</td>
-                </tr>
-            """
-            items_html_rows.append(item_row_html)
-        final_items_html = ''.join(items_html_rows)
-
-        # --- REPLACE ALL PLACEHOLDERS ---
-        html_body = html_template
-        html_body = html_body.replace('__RECEIPT_ID_PLACEHOLDER__', str(order_details.get('orderId', 'N/A')))
-        html_body = html_body.replace('__ITEMS_LIST_PLACEHOLDER__', final_items_html)
-        html_body = html_body.replace('__AMOUNT_PLACEHOLDER__', amount_text)
-        html_body = html_body.replace('__DATE_PLACEHOLDER__', date_text)
-        html_body = html_body.replace('__PAYMENT_METHOD_CHIPS_PLACEHOLDER__', chips_html)
-        
-        # --- FIX: Safe Decimal Conversion for Subtotal/Tax ---
-        subtotal_val = order_details.get('subtotalCents')
-        if subtotal_val is not None:
-             subtotal = Decimal(subtotal_val) / 100
-        else:
-             subtotal = Decimal('0.00')
-
-        tax_val = order_details.get('taxTotalCents')
-        if tax_val is not None:
-             tax = Decimal(tax_val) / 100
-        else:
-             tax = Decimal('0.00')
-
-        html_body = html_body.replace('__SUBTOTAL_PLACEHOLDER__', f'CA${subtotal:.2f}')
-        html_body = html_body.replace('__TAX_PLACEHOLDER__', f'CA${tax:.2f}')
+        # Template, chips and item rows are cached per container (see receipt_renderer.py)
+        html_body = render_receipt(order_details, payment_details, items_list)
 
         # Send the email
-        response = ses_client.send_email(
+        response = get_ses_client().send_email(
             Source=SENDER_EMAIL,
             Destination={'ToAddresses': [recipient_email]},
             Message={
@@ -160,14 +274,121 @@ def send_receipt_email(recipient_email, order_details, payment_details, items_li
         logger.error(f"Failed to send email to {recipient_email}", exc_info=True)
         return False
 
+def queue_or_send_receipt(recipient_email, order_details, payment_details, items_list):
+    """Queues the receipt for the batch consumer, or sends it inline if no queue is configured."""
+    receipt_queue = get_receipt_queue()
+    if receipt_queue is None or not recipient_email:
+        return send_receipt_email(recipient_email, order_details, payment_details, items_list)
+    try:
+        message_id = receipt_queue.send(encode_receipt_job(recipient_email, order_details, payment_details, items_list))
+        logger.info(f"Step 3 COMPLETE: Receipt for {order_details.get('orderId')} queued ({message_id}).")
+        return True
+    except Exception as e:
+        logger.error(f"Could not queue receipt, sending inline instead: {e}", exc_info=True)
+        return send_receipt_email(recipient_email, order_details, payment_details, items_list)
+
+def handle_receipt_batch(event):
+    """SQS consumer: renders and sends each queued receipt.
+
+    Returns a partial batch response so only the failed messages are retried
+    (requires ReportBatchItemFailures on the event source mapping).
+    """
+    failures = []
+    for record in event.get('Records', []):
+        try:
+            job = decode_receipt_job(record['body'])
+            sent = send_receipt_email(job['recipient_email'], job['order_details'], job['payment_details'], job['items_list'])
+        except Exception as e:
+            logger.error(f"Could not process receipt job {record.get('messageId')}: {e}", exc_info=True)
+            sent = False
+        if not sent:
+            failures.append({'itemIdentifier': record['messageId']})
+    logger.info(f"Receipt batch done: {len(event.get('Records', [])) - len(failures)} sent, {len(failures)} failed")
+    return {'batchItemFailures': failures}
+
 # --- Core Order Processing Logic ---
-def process_order(order_data, payment_details):
-    order_id = order_data.get('order_id')
-    logger.info(f"Processing order: {order_id}")
+def save_order(item_to_save_in_db):
+    orders_table = get_orders_table()
+    if not orders_table:
+        logger.error("orders_table is None - cannot save to DynamoDB!")
+        return
+    try:
+        orders_table.put_item(Item=item_to_save_in_db)
+        logger.info("Step 1 COMPLETE: Successfully saved order to DynamoDB.")
+    except Exception as e:
+        logger.error(f"DynamoDB put_item FAILED: {e}", exc_info=True)
+        raise
+
+def handle_order_stream(event):
+    """DynamoDB stream consumer: adds newly inserted orders to the dashboard rollups.
+
+    Runs off the request path, for every writer of the orders table. Each
+    order is one all-or-nothing transaction that is a no-op if the order was
+    already counted, so stream retries are safe. Returns a partial batch
+    response (requires ReportBatchItemFailures on the event source mapping)
+    naming only records that failed transiently; a record that can never be
+    applied (bad order data) is logged and skipped so it can't hold up the
+    rest of its shard.
+    """
+    rollup_table = get_rollup_table()
+    if not rollup_table:
+        logger.warning("Order stream event received but ROLLUP_TABLE_NAME is not set; ignoring it")
+        return {'batchItemFailures': []}
+    started = time.perf_counter()
+    failures = []
+    counted = already_counted = skipped = 0
+    for record in event.get('Records', []):
+        try:
+            order_record = stream_new_image(record)
+            if order_record is None:
+                continue
+            if apply_order(rollup_table, order_record, BUSINESS_TIMEZONE):
+                counted += 1
+            else:
+                already_counted += 1
+        except Exception as e:
+            if is_transient(e):
+                logger.warning(f"Rollup update FAILED for stream record {record.get('eventID')}, will retry: {e}")
+                failures.append({'itemIdentifier': record['dynamodb']['SequenceNumber']})
+            else:
+                logger.error(f"Rollup update SKIPPED for stream record {record.get('eventID')}: {e}", exc_info=True)
+                skipped += 1
+    emit_metrics({'RollupBatchMs': (time.perf_counter() - started) * 1000})
+    emit_metrics({'RollupOrders': counted, 'RollupDuplicates': already_counted,
+                  'RollupUpdateFailures': len(failures), 'RollupSkipped': skipped}, unit='Count')
+    logger.info(f"Rollups: {counted} order(s) counted, {already_counted} already counted, "
+                f"{len(failures)} to retry, {skipped} skipped")
+    return {'batchItemFailures': failures}
 
+def serialize_print_job(order_for_mqtt):
+    """Returns (payload, content type) in the configured PRINT_PAYLOAD_FORMAT."""
+    if PRINT_PAYLOAD_FORMAT == 'compact':
+        from print_codec import CONTENT_TYPE, encode_print_job
+        return encode_print_job(order_for_mqtt), CONTENT_TYPE
+    return json.dumps(order_for_mqtt, default=str), 'application/json'
+
+def publish_order(order_for_mqtt):
+    if not PRINTER_TOPIC:
+        logger.error("PRINTER_TOPIC is None - cannot publish to IoT!")
+        return
+    if order_for_mqtt.get('trace') is not None:
+        order_for_mqtt['trace']['publish_ts'] = time.time()
+    try:
+        payload, content_type = serialize_print_job(order_for_mqtt)
+        get_iot_client().publish(topic=PRINTER_TOPIC, qos=1, payload=payload, contentType=content_type)
+        logger.info("Step 2 COMPLETE: Successfully published order to IoT topic.")
+    except Exception as e:
+        logger.error(f"IoT publish FAILED: {e}", exc_info=True)
+        raise
+
+def build_order_record(order_data):
+    """Normalises an incoming order payload into the item stored in DynamoDB."""
+    order_id = order_data.get('order_id')
     transaction_time = order_data.get('transaction_timestamp')
-    order_date_iso = datetime.fromtimestamp(transaction_time, tz=timezone.utc).isoformat() if transaction_time else datetime.now(timezone.utc).isoformat()
+    # float(): JSON bodies are parsed with parse_float=Decimal
+    order_date_iso = datetime.fromtimestamp(float(transaction_time), tz=timezone.utc).isoformat() if transaction_time else datetime.now(timezone.utc).isoformat()
 
+    # Converted once here; nothing below needs to convert again
     order_data_decimal = replace_floats_with_decimals(order_data)
     total_price = Decimal(str(order_data_decimal.get('total', '0'))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
     
@@ -180,24 +401,23 @@ def process_order(order_data, payment_details):
 
     if items_json:  # Stripe / takeout path
         try:
-            items = replace_floats_with_decimals(json.loads(items_json))
+            items = json.loads(items_json, parse_float=Decimal)
             logger.info("Items successfully parsed from items_summary/items_json")
         except (json.JSONDecodeError, TypeError) as e:
             logger.warning(f"Could not parse items_json: {e}")
 
     elif 'items' in order_data_decimal:  # Dine-in path
-        try:
-            items = replace_floats_with_decimals(order_data_decimal['items'])
-            logger.info("Items taken from direct 'items' list")
-        except Exception as e:
-            logger.warning(f"Could not process direct items list: {e}")
+        items = order_data_decimal['items']
+        logger.info("Items taken from direct 'items' list")
     else:
         logger.info("No items data found in payload – proceeding with empty list")
     
     # --------------------------------------------------------------
 
-    # 1. Save to DynamoDB
-    item_to_save_in_db = {
+    # When the record was written, unlike orderDate (when the customer paid).
+    # sales_report.py reads new orders by it, through a writtenDay/writtenAt index.
+    written_at = datetime.now(timezone.utc)
+    return {
         'orderId': order_id,
         'paymentId': order_data.get('paymentId'),
         'customerName': order_data.get('customerName', 'N/A'),
@@ -210,33 +430,84 @@ def process_order(order_data, payment_details):
         'orderDate': order_date_iso,
         'subtotalCents': safe_decimal_from_metadata(order_data.get('subtotal_cents')),
         'taxTotalCents': safe_decimal_from_metadata(order_data.get('tax_total_cents')),
+        'writtenAt': written_at.isoformat(timespec='microseconds'),
+        'writtenDay': written_at.strftime('%Y-%m-%d'),
     }
-    
-    if orders_table:
-        try:
-            orders_table.put_item(Item=item_to_save_in_db)
-            logger.info("Step 1 COMPLETE: Successfully saved order to DynamoDB.")
-        except Exception as e:
-            logger.error(f"DynamoDB put_item FAILED: {e}", exc_info=True)
-            raise
-    else:
-        logger.error("orders_table is None - cannot save to DynamoDB!")
+
+def order_data_from_payment_intent(payment_intent):
+    """Builds the process_order payload for a succeeded PaymentIntent.
+
+    Returns (order_data, payment_details).
+    """
+    metadata = dict(payment_intent.get('metadata', {}))
+    customer_email, customer_name, payment_details = get_charge_details(payment_intent)
+    order_data = {
+        'receipt_email': customer_email,
+        'customerName': customer_name,
+        'paymentId': payment_intent['id'],
+        'paymentStatus': 'PAID',
+        'transaction_timestamp': payment_intent.get('created'),
+        **metadata
+    }
+    return order_data, payment_details
+
+def process_order(order_data, payment_details, trace=None, redelivered_on_failure=False):
+    order_id = order_data.get('order_id')
+    logger.info(f"Processing order: {order_id}")
+
+    # 1. Save to DynamoDB
+    with trace_step(trace, 'normalise_ms'):
+        item_to_save_in_db = build_order_record(order_data)
+    items = item_to_save_in_db['items']
+    total_price = item_to_save_in_db['total']
+    order_date_iso = item_to_save_in_db['orderDate']
 
     # 2. Publish to IoT for printing
-    order_for_mqtt = {k: item_to_save_in_db.get(k) for k in ['orderId', 'customerName', 'notes', 'orderType', 'items']}
+    order_for_mqtt = {k: item_to_save_in_db.get(k) for k in ['orderId', 'customerName', 'notes', 'orderType', 'items', 'orderDate']}
     order_for_mqtt['total'] = float(total_price)
     order_for_mqtt['table'] = item_to_save_in_db.get('tableId')
     order_for_mqtt['order_id'] = order_id
-    
-    if PRINTER_TOPIC:
-        try:
-            iot_client.publish(topic=PRINTER_TOPIC, qos=1, payload=json.dumps(order_for_mqtt, default=str))
-            logger.info("Step 2 COMPLETE: Successfully published order to IoT topic.")
-        except Exception as e:
-            logger.error(f"IoT publish FAILED: {e}", exc_info=True)
-            raise
+    if trace is not None:
+        trace['order_id'] = order_id
+        order_for_mqtt['trace'] = trace
+
+    # Steps 1 and 2 are both idempotent per orderId (put_item overwrites, the
+    # listener de-duplicates tickets by order_id). Whether they can run
+    # concurrently depends on who retries a failure:
+    #   - Stripe webhook (redelivered_on_failure): a 500 makes Stripe re-deliver
+    #     the event, which redoes both steps. So they run in parallel; if one
+    #     fails the other still finishes, the error is re-raised, and the
+    #     re-delivery fills in whatever is missing.
+    #   - Dine-in: the app posts once and shows the customer an error; nothing
+    #     retries. The order is saved first and only published once it is in
+    #     the table, so the kitchen never prints an order the customer was told
+    #     failed. If the publish fails after the save, the order is in the
+    #     table but not printed, and the customer is told it failed.
+    parallel = PARALLEL_FANOUT and redelivered_on_failure
+    step_timings = {}
+    fanout_started = time.perf_counter()
+    if parallel:
+        futures = {
+            'DynamoDBPutMs': fanout_executor.submit(timed_step, save_order, item_to_save_in_db),
+            'IoTPublishMs': fanout_executor.submit(timed_step, publish_order, order_for_mqtt),
+        }
+        errors = []
+        for metric, future in futures.items():
+            try:
+                step_timings[metric] = future.result()[1]
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
     else:
-        logger.error("PRINTER_TOPIC is None - cannot publish to IoT!")
+        step_timings['DynamoDBPutMs'] = timed_step(save_order, item_to_save_in_db)[1]
+        step_timings['IoTPublishMs'] = timed_step(publish_order, order_for_mqtt)[1]
+    step_timings['FanoutMs'] = (time.perf_counter() - fanout_started) * 1000
+    logger.info(f"Fan-out timings (ms): {step_timings}")
+    if trace is not None:
+        # Logged only: in parallel mode the publish has already gone out
+        logger.info(f"Trace: {json.dumps({**trace, 'fanout': step_timings})}")
+    emit_metrics(step_timings, FanoutMode='parallel' if parallel else 'sequential')
     
     # 3. Conditionally send email receipt
     if order_data.get('orderType') == 'takeout':
@@ -250,59 +521,74 @@ def process_order(order_data, payment_details):
             'subtotalCents': item_to_save_in_db.get('subtotalCents'),
             'taxTotalCents': item_to_save_in_db.get('taxTotalCents')
         }
-        send_receipt_email(recipient_email, order_details_for_email, payment_details, items)
+        queue_or_send_receipt(recipient_email, order_details_for_email, payment_details, items)
 
     return True
 
+def handle_dashboard_request(event, headers):
+    """GET ?day=YYYY-MM-DD (default: today) -> that day's rollups, read in one Query."""
+    request_headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    supplied = request_headers.get('authorization', '')
+    if not DASHBOARD_TOKEN or not hmac.compare_digest(supplied, f"Bearer {DASHBOARD_TOKEN}"):
+        return {'statusCode': 403, 'headers': headers, 'body': json.dumps({'error': 'Forbidden'})}
+    rollup_table = get_rollup_table()
+    if not rollup_table:
+        return {'statusCode': 404, 'headers': headers, 'body': json.dumps({'error': 'Rollups are not enabled'})}
+
+    day = (event.get('queryStringParameters') or {}).get('day') or business_today(BUSINESS_TIMEZONE)
+    try:
+        datetime.strptime(day, '%Y-%m-%d')
+    except ValueError:
+        return {'statusCode': 400, 'headers': headers, 'body': json.dumps({'error': 'day must be YYYY-MM-DD'})}
+    return {'statusCode': 200, 'headers': headers, 'body': json.dumps(read_day(rollup_table, day))}
+
 # --- Main Handler ---
 def lambda_handler(event, context):
     # logger.info(f"Event received: {json.dumps(event)}") # Valid for debug, remove in prod if sensitive
+
+    # Queued receipt jobs arrive from SQS and new orders from the orders
+    # table's stream, rather than from API Gateway
+    event_source = event['Records'][0].get('eventSource') if event.get('Records') else None
+    if event_source == 'aws:sqs':
+        return handle_receipt_batch(event)
+    if event_source == 'aws:dynamodb':
+        return handle_order_stream(event)
     
     # Define CORS headers
     headers = {
         "Access-Control-Allow-Origin": "https://dine-in.momotarosushi.ca",
-        "Access-Control-Allow-Headers": "Content-Type",
-        "Access-Control-Allow-Methods": "POST, OPTIONS"
+        "Access-Control-Allow-Headers": "Content-Type, Authorization",
+        "Access-Control-Allow-Methods": "GET, POST, OPTIONS"
     }
+
+    method = event.get('httpMethod') or event.get('requestContext', {}).get('http', {}).get('method')
+    if method == 'GET':
+        try:
+            return handle_dashboard_request(event, headers)
+        except Exception:
+            logger.error("Dashboard request failed", exc_info=True)
+            return {'statusCode': 500, 'headers': headers, 'body': json.dumps({'error': 'An internal server error occurred.'})}
     
+    trace = new_trace(context)
     try:
         if 'stripe-signature' in event.get('headers', {}):
             payload = event['body']
             sig_header = event['headers']['stripe-signature']
-            stripe_event = stripe.Webhook.construct_event(payload=payload, sig_header=sig_header, secret=webhook_secret)
+            with trace_step(trace, 'verify_ms'):
+                stripe_event = get_stripe().Webhook.construct_event(payload=payload, sig_header=sig_header, secret=webhook_secret)
 
             if stripe_event['type'] == 'payment_intent.succeeded':
                 payment_intent = stripe_event['data']['object']
-                metadata = dict(payment_intent.get('metadata', {}))
-                
-                latest_charge_id = payment_intent.get('latest_charge')
-                customer_email, customer_name, payment_details = None, None, {}
-
-                if latest_charge_id:
-                    try:
-                        charge = stripe.Charge.retrieve(latest_charge_id)
-                        customer_email = charge.billing_details.get('email')
-                        customer_name = charge.billing_details.get('name')
-                        payment_details = charge.payment_method_details
-                        logger.info(f"Successfully retrieved Charge {latest_charge_id}")
-                    except Exception as e:
-                        logger.error(f"Could not retrieve charge {latest_charge_id}: {e}")
-                
-                order_data = {
-                    'receipt_email': customer_email,
-                    'customerName': customer_name,
-                    'paymentId': payment_intent['id'],
-                    'paymentStatus': 'PAID',
-                    'transaction_timestamp': payment_intent.get('created'),
-                    **metadata
-                }
-                
-                process_order(order_data, payment_details)
+                trace['source_ts'] = payment_intent.get('created') # When the customer paid
+                with trace_step(trace, 'charge_ms'):
+                    order_data, payment_details = order_data_from_payment_intent(payment_intent)
+                process_order(order_data, payment_details, trace, redelivered_on_failure=True)
         else:
             # Handle Dine-In API calls
-            order_data = json.loads(event['body'])
+            with trace_step(trace, 'parse_ms'):
+                order_data = json.loads(event['body'], parse_float=Decimal)
             order_data['paymentStatus'] = 'Dine-In'
-            process_order(order_data, {})
+            process_order(order_data, {}, trace)
 
         return {
             'statusCode': 200,
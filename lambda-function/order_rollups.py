@@ -0,0 +1,219 @@
+from datetime import datetime
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
+# Pre-aggregated sales counters, kept up to date as orders are saved so the
+# dashboard never scans the orders table. They are applied off the request
+# path: lambda_handler consumes the orders table's DynamoDB stream, so every
+# write - webhooks, dine-in calls and bulk_ingest.py's batch writes - is
+# rolled up the same way.
+#
+# Rollup table (partition key `pk`, sort key `sk`), one partition per
+# business day:
+#
+#   pk=DAY#2026-10-16  sk=TOTAL          orders, revenueCents
+#   pk=DAY#2026-10-16  sk=HOUR#18        orders, revenueCents
+#   pk=DAY#2026-10-16  sk=ITEM#<name>    quantity, revenueCents
+#
+#   pk=ORDER#<orderId>  sk=APPLIED       marker: this order is counted
+#
+# Every counter is bumped with an atomic ADD, so concurrent orders never lose
+# updates and no read-modify-write is needed. One order's updates and its
+# marker go in a single TransactWriteItems call: either all counters move or
+# none do, and the marker's attribute_not_exists condition makes a stream
+# retry of an order that was already counted a no-op (ADD alone is not
+# idempotent). An order with more distinct items than fit in one transaction
+# counts the overflow under a single "Other items" row.
+#
+# A stream record is only worth retrying if the failure was transient
+# (is_transient): a retried record holds up every later order on its shard,
+# so records that would fail the same way every time are logged and skipped.
+
+DAY_PREFIX = 'DAY#'
+TOTAL_KEY = 'TOTAL'
+HOUR_PREFIX = 'HOUR#'
+ITEM_PREFIX = 'ITEM#'
+ORDER_PREFIX = 'ORDER#'
+APPLIED_KEY = 'APPLIED'
+MAX_TRANSACTION_ACTIONS = 100 # TransactWriteItems limit
+MAX_ITEM_ROWS = MAX_TRANSACTION_ACTIONS - 3 # After the marker, TOTAL and HOUR rows
+OTHER_ITEMS_NAME = 'Other items'
+
+# Error codes and cancellation reasons that a later retry can get past
+TRANSIENT_ERROR_CODES = {
+    'TransactionConflict', 'TransactionInProgressException',
+    'ThrottlingError', 'ThrottlingException', 'RequestLimitExceeded',
+    'ProvisionedThroughputExceeded', 'ProvisionedThroughputExceededException',
+    'InternalServerError', 'ServiceUnavailable',
+}
+
+
+def _cents(value):
+    return int((Decimal(str(value or 0)) * 100).to_integral_value())
+
+
+def business_time(order_date_iso, tz):
+    """(day 'YYYY-MM-DD', hour 0-23) of an ISO orderDate in the restaurant's timezone."""
+    local = datetime.fromisoformat(order_date_iso).astimezone(ZoneInfo(tz))
+    return local.strftime('%Y-%m-%d'), local.hour
+
+
+def rollup_updates(order_record, tz='UTC'):
+    """UpdateItem arguments that fold one saved order into its day's counters."""
+    day, hour = business_time(order_record['orderDate'], tz)
+    pk = DAY_PREFIX + day
+    revenue = _cents(order_record.get('total'))
+
+    updates = [
+        {'Key': {'pk': pk, 'sk': sk},
+         'UpdateExpression': 'ADD #orders :one, #revenue :revenue',
+         'ExpressionAttributeNames': {'#orders': 'orders', '#revenue': 'revenueCents'},
+         'ExpressionAttributeValues': {':one': 1, ':revenue': revenue}}
+        for sk in (TOTAL_KEY, f"{HOUR_PREFIX}{hour:02d}")
+    ]
+
+    # Same item on two cart lines (different options) is one counter update
+    items = {}
+    for item in order_record.get('items') or []:
+        name = str(item.get('name') or (item.get('menuItem') or {}).get('name') or 'Unknown Item')
+        quantity = int(item.get('quantity') or 1)
+        if item.get('subtotal') is not None:
+            item_revenue = _cents(item['subtotal'])
+        else:
+            item_revenue = _cents(item.get('price', item.get('finalPrice'))) * quantity
+        if name not in items and len(items) >= MAX_ITEM_ROWS - 1:
+            name = OTHER_ITEMS_NAME # Keeps the last row free for the overflow
+        counters = items.setdefault(name, [0, 0])
+        counters[0] += quantity
+        counters[1] += item_revenue
+    for name, (quantity, item_revenue) in items.items():
+        updates.append({
+            'Key': {'pk': pk, 'sk': ITEM_PREFIX + name},
+            'UpdateExpression': 'ADD #quantity :quantity, #revenue :revenue',
+            'ExpressionAttributeNames': {'#quantity': 'quantity', '#revenue': 'revenueCents'},
+            'ExpressionAttributeValues': {':quantity': quantity, ':revenue': item_revenue},
+        })
+    return updates
+
+
+def rollup_transaction(table_name, order_record, tz='UTC'):
+    """TransactItems that count one order exactly once: the marker Put plus every counter Update."""
+    marker = {'Put': {
+        'TableName': table_name,
+        'Item': {'pk': ORDER_PREFIX + str(order_record['orderId']), 'sk': APPLIED_KEY,
+                 'orderDate': order_record['orderDate']},
+        'ConditionExpression': 'attribute_not_exists(pk)',
+    }}
+    return [marker] + [{'Update': {'TableName': table_name, **update}} for update in rollup_updates(order_record, tz)]
+
+
+def apply_order(table, order_record, tz='UTC'):
+    """Adds a saved order to the rollup table in one transaction.
+
+    Returns the number of counters updated, or 0 if the order was already
+    counted.
+    """
+    actions = rollup_transaction(table.name, order_record, tz)
+    client = table.meta.client
+    try:
+        client.transact_write_items(TransactItems=actions)
+    except client.exceptions.TransactionCanceledException as e:
+        reasons = e.response.get('CancellationReasons') or [{}]
+        if reasons[0].get('Code') == 'ConditionalCheckFailed':
+            return 0
+        raise
+    return len(actions) - 1
+
+
+def is_transient(error):
+    """True if retrying the stream record that raised `error` can succeed.
+
+    Conflicting transactions, throttling, 5xx responses and network errors
+    are transient; bad order data, validation errors and anything else fail
+    the same way on every retry.
+    """
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        if (response.get('ResponseMetadata') or {}).get('HTTPStatusCode', 0) >= 500:
+            return True
+        codes = {(response.get('Error') or {}).get('Code')}
+        codes.update(reason.get('Code') for reason in response.get('CancellationReasons') or [])
+        return bool(codes & TRANSIENT_ERROR_CODES)
+    network_errors = (ConnectionError, TimeoutError)
+    try:
+        from botocore.exceptions import HTTPClientError # Connection errors and read timeouts
+        network_errors += (HTTPClientError,)
+    except ImportError:
+        pass
+    return isinstance(error, network_errors)
+
+
+# --- Stream Records ---
+def _attribute_value(value):
+    """One DynamoDB-JSON attribute value -> Python (numbers as Decimal)."""
+    (kind, data), = value.items()
+    if kind == 'S':
+        return data
+    if kind == 'N':
+        return Decimal(data)
+    if kind == 'BOOL':
+        return data
+    if kind == 'NULL':
+        return None
+    if kind == 'M':
+        return {k: _attribute_value(v) for k, v in data.items()}
+    if kind == 'L':
+        return [_attribute_value(v) for v in data]
+    if kind == 'SS':
+        return set(data)
+    if kind == 'NS':
+        return {Decimal(n) for n in data}
+    return data # B / BS: left as sent
+
+
+def stream_new_image(record):
+    """The item written by an INSERT stream record, as a plain dict; None for other events.
+
+    Decoded here rather than with boto3's TypeDeserializer so the stream
+    consumer doesn't import boto3 for it.
+    """
+    if record.get('eventName') != 'INSERT':
+        return None
+    image = (record.get('dynamodb') or {}).get('NewImage')
+    if not image:
+        return None
+    return {k: _attribute_value(v) for k, v in image.items()}
+
+
+def read_day(table, day):
+    """Dashboard numbers for one business day, from a single Query on its partition.
+
+    A day has one row per menu item sold plus 25 fixed rows, well under the
+    1 MB a Query page returns, so one request covers the whole day. (The
+    per-order markers live in their own partitions and aren't read.)
+    """
+    response = table.query(
+        KeyConditionExpression='#pk = :pk',
+        ExpressionAttributeNames={'#pk': 'pk'},
+        ExpressionAttributeValues={':pk': DAY_PREFIX + day},
+    )
+    summary = {'day': day, 'orders': 0, 'revenue': 0.0, 'averageTicket': 0.0, 'hours': [], 'items': []}
+    for row in response.get('Items', []):
+        sk = row['sk']
+        revenue = float(Decimal(row.get('revenueCents', 0)) / 100)
+        if sk == TOTAL_KEY:
+            summary['orders'] = int(row.get('orders', 0))
+            summary['revenue'] = revenue
+        elif sk.startswith(HOUR_PREFIX):
+            summary['hours'].append({'hour': int(sk[len(HOUR_PREFIX):]), 'orders': int(row.get('orders', 0)), 'revenue': revenue})
+        elif sk.startswith(ITEM_PREFIX):
+            summary['items'].append({'name': sk[len(ITEM_PREFIX):], 'quantity': int(row.get('quantity', 0)), 'revenue': revenue})
+    if summary['orders']:
+        summary['averageTicket'] = round(summary['revenue'] / summary['orders'], 2)
+    summary['hours'].sort(key=lambda h: h['hour'])
+    summary['items'].sort(key=lambda i: (-i['quantity'], i['name']))
+    return summary
+
+
+def business_today(tz='UTC'):
+    return datetime.now(ZoneInfo(tz)).strftime('%Y-%m-%d')
@@ -0,0 +1,48 @@
+import json
+from decimal import Decimal
+
+# Receipt jobs are queued by process_order and sent later by the batch
+# consumer in lambda_handler, so the Stripe webhook doesn't wait on SES.
+#
+# Decimals are written as JSON numbers and read back with parse_float=Decimal,
+# so money values survive the round trip as Decimals.
+
+def encode_receipt_job(recipient_email, order_details, payment_details, items_list):
+    return json.dumps({
+        'recipient_email': recipient_email,
+        'order_details': order_details,
+        'payment_details': payment_details or {},
+        'items_list': items_list or [],
+    }, default=float)
+
+def decode_receipt_job(body):
+    return json.loads(body, parse_float=Decimal)
+
+
+class SqsReceiptQueue:
+    """Receipt queue backed by an SQS queue (RECEIPT_QUEUE_URL)."""
+
+    def __init__(self, queue_url, sqs_client):
+        self.queue_url = queue_url
+        self.sqs_client = sqs_client
+
+    def send(self, body):
+        response = self.sqs_client.send_message(QueueUrl=self.queue_url, MessageBody=body)
+        return response['MessageId']
+
+
+class InMemoryReceiptQueue:
+    """Local stand-in for SqsReceiptQueue (see benchmarks/fakes.install_fakes)."""
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, body):
+        message_id = f"local-{len(self.messages) + 1}"
+        self.messages.append({'messageId': message_id, 'body': body})
+        return message_id
+
+    def drain_as_sqs_event(self, batch_size=10):
+        """Pops up to `batch_size` messages wrapped like an SQS Lambda event."""
+        batch, self.messages = self.messages[:batch_size], self.messages[batch_size:]
+        return {'Records': [{**message, 'eventSource': 'aws:sqs'} for message in batch]}
@@ -0,0 +1,120 @@
+import logging
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+
+from receipt_template import get_receipt_template
+
+# Fragment-level rendering for receipt emails. The HTML pieces that repeat
+# across receipts - payment-method chips, item rows, formatted dates - are
+# built once per container and reused, so a receipt is mostly cache lookups
+# and one CompiledTemplate.render. render_receipts() renders a whole batch
+# (e.g. re-sending after an SES outage) with the same caches.
+
+logger = logging.getLogger(__name__)
+
+# --- Payment Method Chips ---
+_CHIP_OPEN = '<div style="display: inline-block; border-radius: 9999px; background-color: {color}; padding: 4px 10px; font-size: 12px; font-weight: 500; color: #ffffff;">'
+
+APPLE_PAY_CHIP = _CHIP_OPEN.format(color='#000000') + 'Apple Pay</div>'
+
+# brand -> chip HTML up to the last four digits
+CARD_CHIP_PREFIXES = {
+    'visa': _CHIP_OPEN.format(color='#2563eb') + 'VISA •••• ',
+    'mastercard': _CHIP_OPEN.format(color='#ea580c') + 'Mastercard •••• ',
+    'amex': _CHIP_OPEN.format(color='#0284c7') + 'AMEX •••• ',
+}
+DEFAULT_CARD_CHIP_PREFIX = _CHIP_OPEN.format(color='#334155') + 'Card •••• '
+
+
+def payment_chip_html(payment_details):
+    """Chip for the payment method; wallets other than Apple Pay get no chip."""
+    card_details = (payment_details or {}).get('card', {})
+    wallet = card_details.get('wallet')
+    if wallet:
+        wallet_type = str(wallet.get('type') if isinstance(wallet, dict) else wallet).lower()
+        return APPLE_PAY_CHIP if 'apple_pay' in wallet_type else ''
+    brand = str(card_details.get('brand', 'card')).lower()
+    prefix = CARD_CHIP_PREFIXES.get(brand, DEFAULT_CARD_CHIP_PREFIX)
+    return f"{prefix}{card_details.get('last4', '')}</div>"
+
+
+# --- Item Rows ---
+@lru_cache(maxsize=2048)
+def item_row_html(name, price, quantity):
+    """One <tr> of the itemised list, cached by (name, price, quantity).
+
+    `price` is the item's finalPrice as given (Decimal, float or str); it is
+    only converted and formatted when the row isn't cached yet.
+    """
+    price = Decimal(str(price))
+    return f"""
+                <tr>
+                    <td style="padding: 8px 0; font-size: 14px; color: #0f172a;">{quantity}x {name}</td>
+                    <td style="padding: 8px 0; font-size: 14px; color: #0f172a; text-align: right;">CA${price:.2f}</td>
+                </tr>
+            """
+
+
+def items_html(items_list):
+    rows = []
+    for item in items_list or []:
+        # Handle nested menuItem structure or flat structure
+        name = item.get('name') or item.get('menuItem', {}).get('name', 'Item')
+        price = item.get('finalPrice', '0.00')
+        try:
+            rows.append(item_row_html(name, price, item.get('quantity', 1)))
+        except TypeError:  # Unhashable value; render it uncached
+            rows.append(item_row_html.__wrapped__(name, price, item.get('quantity', 1)))
+    return ''.join(rows)
+
+
+# --- Amounts and Dates ---
+@lru_cache(maxsize=512)
+def receipt_date_text(paid_at_iso):
+    if not paid_at_iso:
+        return "N/A"
+    try:
+        # Handle ISO format including Z for UTC
+        return datetime.fromisoformat(paid_at_iso.replace('Z', '+00:00')).strftime('%b %d, %Y')
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.error(f"Could not parse date {paid_at_iso}: {e}")
+        return "N/A"
+
+
+def cents_text(cents):
+    return f"CA${(Decimal(cents) / 100 if cents is not None else Decimal('0.00')):.2f}"
+
+
+# --- Rendering ---
+def render_receipt(order_details, payment_details, items_list):
+    """Full receipt email HTML for one order."""
+    total = order_details.get('total', Decimal('0.00'))
+    return get_receipt_template().render({
+        'RECEIPT_ID': str(order_details.get('orderId', 'N/A')),
+        'ITEMS_LIST': items_html(items_list),
+        'AMOUNT': f"CA${total:.2f}",
+        'DATE': receipt_date_text(order_details.get('paidAt_iso')),
+        'PAYMENT_METHOD_CHIPS': payment_chip_html(payment_details),
+        'SUBTOTAL': cents_text(order_details.get('subtotalCents')),
+        'TAX': cents_text(order_details.get('taxTotalCents')),
+    })
+
+
+def render_receipts(jobs):
+    """Renders many receipts; `jobs` yields (order_details, payment_details, items_list).
+
+    Returns a list with the HTML for each job, or None where that job could
+    not be rendered, so one bad receipt doesn't stop a bulk re-send.
+    """
+    template = get_receipt_template()  # Fail fast if the template is missing
+    rendered = []
+    for order_details, payment_details, items_list in jobs:
+        try:
+            rendered.append(render_receipt(order_details, payment_details, items_list))
+        except Exception as e:
+            logger.error(f"Could not render receipt for {order_details.get('orderId')}: {e}", exc_info=True)
+            rendered.append(None)
+    logger.info(f"Rendered {sum(html is not None for html in rendered)}/{len(rendered)} receipts "
+                f"({len(template.placeholders)} placeholders, row cache {item_row_html.cache_info().currsize})")
+    return rendered
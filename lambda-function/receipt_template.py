@@ -0,0 +1,47 @@
+import os
+import re
+
+# Placeholders in emailtemplate.html look like __AMOUNT_PLACEHOLDER__
+PLACEHOLDER_PATTERN = re.compile(r'__([A-Z0-9_]+?)_PLACEHOLDER__')
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'emailtemplate.html')
+
+
+class CompiledTemplate:
+    """HTML template pre-split into literal segments and placeholder slots.
+
+    Rendering fills the slots and does a single ''.join instead of one full
+    str.replace pass over the template per placeholder.
+    """
+
+    def __init__(self, source):
+        self._parts = []
+        self._slots = []  # (index into _parts, placeholder name, original token)
+        pos = 0
+        for match in PLACEHOLDER_PATTERN.finditer(source):
+            self._parts.append(source[pos:match.start()])
+            self._slots.append((len(self._parts), match.group(1), match.group(0)))
+            self._parts.append(match.group(0))
+            pos = match.end()
+        self._parts.append(source[pos:])
+
+    @property
+    def placeholders(self):
+        return {name for _, name, _ in self._slots}
+
+    def render(self, values):
+        """Fills placeholders by name (e.g. 'AMOUNT'); unknown ones are left as-is."""
+        parts = self._parts.copy()
+        for index, name, token in self._slots:
+            parts[index] = values.get(name, token)
+        return ''.join(parts)
+
+
+# Loaded once per Lambda container and reused by warm invocations
+_receipt_template = None
+
+def get_receipt_template():
+    global _receipt_template
+    if _receipt_template is None:
+        with open(TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+            _receipt_template = CompiledTemplate(f.read())
+    return _receipt_template
@@ -0,0 +1,403 @@
+"""Daily sales reports built from the orders table.
+
+Streams orders from DynamoDB (or a JSON-lines export of the table, one order
+per line), turns each page into NumPy columns and aggregates it in one
+vectorised pass into:
+
+  - per day:           orders, revenue, average ticket
+  - per day and item:  quantity sold, revenue
+  - per day and table: orders (table turnover), revenue
+
+Days are business days in BUSINESS_TIMEZONE (or --timezone), bucketed exactly
+like the dashboard rollups in order_rollups.py.
+
+The rollups are cached in a JSON file together with a watermark: the newest
+writtenAt (the time build_order_record wrote the order, not its orderDate)
+folded in, plus the ids of recently counted orders. A re-run only reads
+orders written since the watermark, less an OVERLAP_SECONDS window for writes
+that became visible out of order, and skips ids it has already counted - so
+slow checkouts, webhook retries and backfills are all picked up once. Only
+ids a later run could read again are kept (see prune_counted), so the cache
+doesn't grow with the order history.
+
+New orders are read with a Query per day on a global secondary index of the
+orders table (partition key `writtenDay`, sort key `writtenAt`, projecting
+at least the attributes in SCAN_ATTRIBUTES), named by --index or
+ORDERS_WRITTEN_INDEX, so a run only reads - and pays for - what was written
+since the last one. Without the index the whole table is scanned. --rebuild
+always scans, and is the only way orders written before writtenAt existed
+are counted.
+
+Meant to be run by hand or from a scheduled job, not inside the webhook
+Lambda, so NumPy is not part of the Lambda package:
+
+    pip install numpy boto3
+    python sales_report.py [--jsonl orders.jsonl] [--from 2026-10-01] [--to 2026-10-16]
+"""
+import os
+import json
+import logging
+import argparse
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from bulk_ingest import read_jsonl
+from lambda_function import BUSINESS_TIMEZONE, get_orders_table
+from order_rollups import business_time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = 'sales_rollup.json'
+CACHE_VERSION = 3
+PAGE_ORDERS = 1000  # Orders per columnar batch when reading a JSON-lines file
+TOP_ITEMS = 10
+OVERLAP_SECONDS = 300  # Re-read this much before the watermark; concurrent writers commit out of order
+COUNTED_DAYS = 3  # Stripe re-delivers a webhook (re-writing its order) for up to 3 days
+WRITTEN_INDEX = os.environ.get('ORDERS_WRITTEN_INDEX')
+
+# Only the attributes the report needs are fetched from DynamoDB
+SCAN_ATTRIBUTES = {'#id': 'orderId', '#date': 'orderDate', '#total': 'total',
+                   '#table': 'tableId', '#type': 'orderType', '#items': 'items', '#written': 'writtenAt'}
+
+
+# --- Order Sources ---
+def _pages(operation, kwargs):
+    while True:
+        page = operation(**kwargs)
+        yield page.get('Items', [])
+        if not page.get('LastEvaluatedKey'):
+            return
+        kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def scan_orders(table, since=None):
+    """Yields pages of orders from a paginated scan, optionally only writtenAt >= since.
+
+    The filter only trims what is returned: a scan reads the whole table.
+    """
+    kwargs = {
+        'ProjectionExpression': ', '.join(SCAN_ATTRIBUTES),
+        'ExpressionAttributeNames': SCAN_ATTRIBUTES,
+    }
+    if since:
+        kwargs['FilterExpression'] = '#written >= :since'
+        kwargs['ExpressionAttributeValues'] = {':since': since}
+    yield from _pages(table.scan, kwargs)
+
+
+def query_written_since(table, index, since, now=None):
+    """Yields pages of orders written at or after `since`, one Query per UTC day on the writtenDay/writtenAt index."""
+    day = datetime.fromisoformat(since).astimezone(timezone.utc).date()
+    today = (now or datetime.now(timezone.utc)).date()
+    while day <= today:
+        yield from _pages(table.query, {
+            'IndexName': index,
+            'KeyConditionExpression': '#day = :day AND #written >= :since',
+            'ProjectionExpression': ', '.join(SCAN_ATTRIBUTES),
+            'ExpressionAttributeNames': {**SCAN_ATTRIBUTES, '#day': 'writtenDay'},
+            'ExpressionAttributeValues': {':day': day.isoformat(), ':since': since},
+        })
+        day += timedelta(days=1)
+
+
+def read_since(rollup):
+    """Where the next incremental read starts: the watermark less the overlap window (None = everything)."""
+    if not rollup['watermark']:
+        return None
+    since = datetime.fromisoformat(rollup['watermark']) - timedelta(seconds=OVERLAP_SECONDS)
+    return since.isoformat(timespec='microseconds')
+
+
+def jsonl_pages(lines, since=None, page_size=PAGE_ORDERS):
+    """Yields pages of orders from a JSON-lines export, optionally only writtenAt >= since (like scan_orders)."""
+    page = []
+    for order in read_jsonl(lines):
+        if since and (order.get('writtenAt') or '') < since:
+            continue
+        page.append(order)
+        if len(page) >= page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+# --- Columnar Aggregation ---
+def _cents(value):
+    """Money (Decimal, float, int or str) to integer cents."""
+    try:
+        return int((Decimal(str(value)) * 100).to_integral_value())
+    except (ArithmeticError, ValueError, TypeError):
+        return 0
+
+
+def _item_revenue_cents(item, quantity):
+    if item.get('subtotal') is not None:
+        return _cents(item['subtotal'])
+    return _cents(item.get('price', item.get('finalPrice', 0))) * quantity
+
+
+def business_day(order_date, tz):
+    """'YYYY-MM-DD' business day of an ISO orderDate, the same way order_rollups buckets it."""
+    return business_time(order_date, tz)[0]
+
+
+class OrderColumns:
+    """A page of orders flattened into parallel NumPy arrays.
+
+    Order columns have one row per order; item columns have one row per line
+    item, carrying the day of the order it belongs to. `days` holds each
+    order's business day.
+    """
+
+    def __init__(self, orders, days):
+        order_ids, tables, totals = [], [], []
+        item_rows, item_names, item_qty, item_cents = [], [], [], []
+        for order in orders:
+            row = len(order_ids)
+            order_ids.append(order['orderId'])
+            tables.append(str(order.get('tableId') or order.get('orderType') or 'unknown'))
+            totals.append(_cents(order.get('total', 0)))
+            for item in order.get('items') or []:
+                quantity = int(item.get('quantity') or 1)
+                item_rows.append(row)
+                item_names.append(str(item.get('name') or (item.get('menuItem') or {}).get('name') or 'Unknown Item'))
+                item_qty.append(quantity)
+                item_cents.append(_item_revenue_cents(item, quantity))
+
+        self.order_ids = order_ids
+        self.days = np.array(days, dtype=str)
+        self.tables = np.array(tables, dtype=str)
+        self.totals = np.array(totals, dtype=np.int64)
+        self.item_days = self.days[np.array(item_rows, dtype=np.intp)]
+        self.item_names = np.array(item_names, dtype=str)
+        self.item_qty = np.array(item_qty, dtype=np.int64)
+        self.item_cents = np.array(item_cents, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.order_ids)
+
+
+def _group_by_pair(outer, inner, *values):
+    """Sums `values` per distinct (outer, inner) pair.
+
+    Returns (outer keys, inner keys, row counts, *sums), one entry per pair.
+    """
+    outer_keys, outer_codes = np.unique(outer, return_inverse=True)
+    inner_keys, inner_codes = np.unique(inner, return_inverse=True)
+    pairs, pair_codes = np.unique(outer_codes * len(inner_keys) + inner_codes, return_inverse=True)
+    counts = np.bincount(pair_codes, minlength=len(pairs))
+    sums = [np.bincount(pair_codes, weights=value, minlength=len(pairs)).round().astype(np.int64) for value in values]
+    return (outer_keys[pairs // len(inner_keys)], inner_keys[pairs % len(inner_keys)], counts, *sums)
+
+
+def aggregate(columns):
+    """Rolls one OrderColumns page up into {day: summary} (same shape as the cache's 'days')."""
+    days = {}
+    if not len(columns):
+        return days
+
+    def day_entry(day):
+        return days.setdefault(str(day), {'orders': 0, 'revenue_cents': 0, 'items': {}, 'tables': {}})
+
+    for day, table, orders, revenue in zip(*_group_by_pair(columns.days, columns.tables, columns.totals)):
+        entry = day_entry(day)
+        entry['orders'] += int(orders)
+        entry['revenue_cents'] += int(revenue)
+        entry['tables'][str(table)] = {'orders': int(orders), 'revenue_cents': int(revenue)}
+
+    if len(columns.item_names):
+        grouped = _group_by_pair(columns.item_days, columns.item_names, columns.item_qty, columns.item_cents)
+        for day, name, _, quantity, revenue in zip(*grouped):
+            day_entry(day)['items'][str(name)] = {'quantity': int(quantity), 'revenue_cents': int(revenue)}
+    return days
+
+
+def merge_days(into, days):
+    """Adds per-day summaries into the cached ones in place."""
+    for day, summary in days.items():
+        entry = into.setdefault(day, {'orders': 0, 'revenue_cents': 0, 'items': {}, 'tables': {}})
+        entry['orders'] += summary['orders']
+        entry['revenue_cents'] += summary['revenue_cents']
+        for group in ('items', 'tables'):
+            for key, counters in summary[group].items():
+                target = entry[group].setdefault(key, dict.fromkeys(counters, 0))
+                for name, value in counters.items():
+                    target[name] += value
+    return into
+
+
+# --- Incremental Cache ---
+def empty_rollup(tz='UTC'):
+    # counted: day -> {orderId: latest writtenAt} of recently counted orders
+    return {'version': CACHE_VERSION, 'timezone': tz, 'watermark': None, 'counted': {}, 'days': {}}
+
+
+def load_rollup(path, tz='UTC'):
+    """Loads the cached rollup, starting over if it's missing or was built differently."""
+    if not os.path.exists(path):
+        return empty_rollup(tz)
+    with open(path, 'r', encoding='utf-8') as f:
+        rollup = json.load(f)
+    if rollup.get('version') != CACHE_VERSION or rollup.get('timezone') != tz:
+        logger.info(f"Rollup cache {path} was built with different settings; rebuilding")
+        return empty_rollup(tz)
+    return rollup
+
+
+def save_rollup(rollup, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(rollup, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def update_rollup(rollup, pages):
+    """Folds orders not counted yet into the rollup; returns how many were added.
+
+    Sources overlap the last run (the overlap window, an export has
+    everything, a re-written order comes back with a new writtenAt), so every
+    order is checked against the ids already counted on its day. The
+    watermark moves to the newest writtenAt seen.
+    """
+    tz = rollup['timezone']
+    counted = {day: dict(ids) for day, ids in rollup['counted'].items()}
+    watermark = rollup['watermark']
+    added = 0
+    for page in pages:
+        fresh, days = [], []
+        for order in page:
+            written_at = order.get('writtenAt')
+            if written_at and (watermark is None or written_at > watermark):
+                watermark = written_at
+            if not order.get('orderId') or not order.get('orderDate'):
+                continue
+            day = business_day(order['orderDate'], tz)
+            ids = counted.setdefault(day, {})
+            seen = order['orderId'] in ids
+            ids[order['orderId']] = max(ids.get(order['orderId'], ''), written_at or '')
+            if seen:
+                continue
+            fresh.append(order)
+            days.append(day)
+        if not fresh:
+            continue
+        columns = OrderColumns(fresh, days)
+        merge_days(rollup['days'], aggregate(columns))
+        added += len(columns)
+
+    rollup['watermark'] = watermark
+    rollup['counted'] = prune_counted(counted, watermark, tz)
+    return added
+
+
+def prune_counted(counted, watermark, tz):
+    """Keeps only the counted ids a run after `watermark` could read again.
+
+    Those are orders written within the re-read window (plus the same again
+    as a margin), and orders of the last COUNTED_DAYS business days, which a
+    webhook re-delivery can re-write with a new writtenAt.
+    """
+    if watermark is None:
+        return counted
+    newest = datetime.fromisoformat(watermark)
+    written_since = (newest - timedelta(seconds=2 * OVERLAP_SECONDS)).isoformat(timespec='microseconds')
+    first_day = business_day((newest - timedelta(days=COUNTED_DAYS)).isoformat(), tz)
+    kept = {}
+    for day, ids in sorted(counted.items()):
+        recent = ids if day >= first_day else {i: at for i, at in ids.items() if at >= written_since}
+        if recent:
+            kept[day] = dict(sorted(recent.items()))
+    return kept
+
+
+# --- Reports ---
+def summarize(rollup, start=None, end=None, top=TOP_ITEMS):
+    """Report for days in [start, end] (inclusive 'YYYY-MM-DD' strings; None = open)."""
+    days = {day: summary for day, summary in sorted(rollup['days'].items())
+            if (start is None or day >= start) and (end is None or day <= end)}
+    combined = {'orders': 0, 'revenue_cents': 0, 'items': {}, 'tables': {}}
+    for summary in days.values():
+        merge_days({'range': combined}, {'range': summary})
+
+    def money(cents):
+        return round(cents / 100, 2)
+
+    items = sorted(combined['items'].items(), key=lambda kv: (-kv[1]['quantity'], kv[0]))
+    tables = sorted(combined['tables'].items(), key=lambda kv: (-kv[1]['orders'], kv[0]))
+    return {
+        'from': start or next(iter(days), None),
+        'to': end or next(reversed(days), None),
+        'orders': combined['orders'],
+        'revenue': money(combined['revenue_cents']),
+        'average_ticket': money(combined['revenue_cents'] / combined['orders']) if combined['orders'] else 0.0,
+        'days': [
+            {'day': day, 'orders': s['orders'], 'revenue': money(s['revenue_cents']),
+             'average_ticket': money(s['revenue_cents'] / s['orders']) if s['orders'] else 0.0}
+            for day, s in days.items()
+        ],
+        'top_items': [
+            {'name': name, 'quantity': c['quantity'], 'revenue': money(c['revenue_cents'])}
+            for name, c in items[:top]
+        ],
+        'tables': [
+            {'table': table, 'orders': c['orders'], 'revenue': money(c['revenue_cents']),
+             'orders_per_day': round(c['orders'] / len(days), 2) if days else 0.0}
+            for table, c in tables
+        ],
+        'watermark': rollup['watermark'],
+    }
+
+
+def format_report(report):
+    lines = [f"Sales {report['from']} .. {report['to']}: {report['orders']} orders, "
+             f"${report['revenue']:.2f} revenue, ${report['average_ticket']:.2f} average ticket", "",
+             f"{'day':<12}{'orders':>8}{'revenue':>12}{'avg':>9}"]
+    lines += [f"{d['day']:<12}{d['orders']:>8}{d['revenue']:>12.2f}{d['average_ticket']:>9.2f}" for d in report['days']]
+    lines += ["", f"{'top items':<32}{'qty':>6}{'revenue':>12}"]
+    lines += [f"{i['name'][:31]:<32}{i['quantity']:>6}{i['revenue']:>12.2f}" for i in report['top_items']]
+    lines += ["", f"{'table':<16}{'orders':>8}{'per day':>9}{'revenue':>12}"]
+    lines += [f"{t['table'][:15]:<16}{t['orders']:>8}{t['orders_per_day']:>9.2f}{t['revenue']:>12.2f}" for t in report['tables']]
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Daily sales, top items and table turnover from the orders table.")
+    parser.add_argument('--jsonl', help="Read orders from a JSON-lines export instead of scanning DynamoDB")
+    parser.add_argument('--from', dest='start', help="First day (YYYY-MM-DD) to report")
+    parser.add_argument('--to', dest='end', help="Last day (YYYY-MM-DD) to report")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help="Rollup cache file")
+    parser.add_argument('--rebuild', action='store_true', help="Ignore the cache and re-read every order")
+    parser.add_argument('--timezone', default=BUSINESS_TIMEZONE, help="Business day timezone (default: BUSINESS_TIMEZONE)")
+    parser.add_argument('--index', default=WRITTEN_INDEX, help="writtenDay/writtenAt index for incremental reads")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    rollup = empty_rollup(args.timezone) if args.rebuild else load_rollup(args.cache, args.timezone)
+    since = read_since(rollup)
+    if args.jsonl:
+        with open(args.jsonl, 'r', encoding='utf-8') as f:
+            added = update_rollup(rollup, jsonl_pages(f, since=since))
+    else:
+        table = get_orders_table()
+        if table is None:
+            raise RuntimeError("DYNAMODB_TABLE_NAME is not set - nothing to scan")
+        if since and args.index:
+            pages = query_written_since(table, args.index, since)
+        else:
+            if since:
+                logger.warning("No writtenDay/writtenAt index given (--index); scanning the whole table")
+            pages = scan_orders(table, since=since)
+        added = update_rollup(rollup, pages)
+    save_rollup(rollup, args.cache)
+    logger.info(f"Folded {added} new orders into {args.cache} (watermark {rollup['watermark']})")
+
+    report = summarize(rollup, args.start, args.end)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -10,36 +10,16 @@ from datetime import datetime
 from concurrent.futures import Future
 from awsiot import mqtt5_client_builder
 from awscrt import mqtt5
-from escpos.printer import Usb
-# Add this near the top of your script
-import logging
-
-logging.basicConfig(
-    filename='printer_listener.log', # Log file will be created in the same directory
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
-
-# --- Replace print with logging ---
-
-# Example of replacing a print statement:
-# Old: print("✓ Printer initialized successfully")
-# New:
-logging.info("Printer initialized successfully")
-
-# For errors, use logging.error or logging.exception
-# Old: print(f"ERROR: Could not print order. Reason: {e}")
-# New:
-logging.error(f"Could not print order.", exc_info=True) # exc_info=True logs the full error traceback
-
-# In your main `except` block:
-# Old: print(f"An unexpected error occurred: {e}")
-# New:
-logging.critical("A critical error occurred in the main loop.", exc_info=True)
-
-
-
+from escpos.printer import Dummy, File, Usb
+from ticket_renderer import render_ticket
+from ticket_images import HeaderRasterCache, NvLogoStore, TicketBranding, load_logo
+from print_codec import CodecError, decode_print_job
+from print_queue import PrintJob, PrinterWorker, TicketGroup, TicketJob
+from order_spool import OrderSpool
+from order_dedupe import DedupeCache
+from order_backlog import BacklogDrainer
+from printer_routing import PrinterRouter, usb_ids
+from listener_metrics import Counter, Gauge, Histogram, MetricsRegistry, start_metrics_server
 
 # --- Automatic Path Configuration ---
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -61,105 +41,437 @@ PATH_TO_PRIVATE_KEY = os.path.join(script_dir, "153975d756b52c7e5b2d82c5540b5734
 PATH_TO_AMAZON_ROOT_CA_1 = os.path.join(script_dir, "AmazonRootCA1.pem")
 PRINTER_TOPIC = "printers/orders/print"
 TIMEOUT = 100
+PRINT_QUEUE_SIZE = 50 # Orders/tickets buffered in memory per queue while the printers catch up
+PRINTER_CONFIG_PATH = os.path.join(script_dir, "printers.json") # Optional; see printers.example.json
+SPOOL_PATH = os.path.join(script_dir, "order_spool.db")
+NV_STATE_PATH = os.path.join(script_dir, "printer_nv_state.json") # Which logo each printer holds in NV memory
+SPOOL_RETENTION_SECONDS = 7 * 24 * 3600 # Printed orders kept in the spool for a week
+PRINTER_RETRY_SECONDS = 15 # How often to reopen failed printers and retry their unprinted orders
+DEDUPE_TTL_SECONDS = 6 * 3600 # How long a printed ticket blocks redeliveries
+DEDUPE_MAX_TICKETS = 8000 # (order id, station) pairs remembered
+SESSION_EXPIRY_SECONDS = 3600 # Broker keeps our subscription and queued QoS-1 orders this long while offline
+KEEP_ALIVE_SECONDS = 30 # Notice a dead connection within ~1.5x this
+RESUBSCRIBE_RETRY_SECONDS = 5 # Wait between re-subscribe attempts after a failed SUBACK
+CATCHUP_ORDERS_PER_SECOND = 2.0 # Backlog drain rate after a reconnect or restart
+CATCHUP_SETTLE_SECONDS = 2.0 # Start draining once the redelivery burst has been quiet this long
+CATCHUP_MAX_WAIT_SECONDS = 15.0 # ...or after this long regardless
+METRICS_PORT = int(os.environ.get('PRINTER_METRICS_PORT', '9108')) # Prometheus /metrics; 0 disables
 
 # --- Globals ---
 shutdown_event = threading.Event()
 future_stopped = Future()
 future_connection_success = Future()
-p = None
+router = None
+printers = {} # printer name -> escpos device (None if it failed to open)
+brandings = {} # printer name -> TicketBranding (logo / raster headers), if configured
+printer_faults = set() # printers whose last write failed; reopened by the recovery thread
+retry_lock = threading.Lock()
+retry_jobs = [] # (PrintJob, stations that failed) waiting for their printers to come back
+nv_store = None
+header_caches = {} # header font -> HeaderRasterCache, shared by printers using that font
+station_workers = {} # printer name -> PrinterWorker with that printer's queue
+intake_worker = None
+backlog = None
+spool = None
+client = None
+connection_state = {'connected': False, 'ever_connected': False, 'disconnected_at': None, 'subscribed': False}
+dedupe = DedupeCache(maxsize=DEDUPE_MAX_TICKETS, ttl=DEDUPE_TTL_SECONDS)
+
+# --- Metrics ---
+def all_workers():
+    return [w for w in [intake_worker, *station_workers.values()] if w is not None]
+
+metrics = MetricsRegistry()
+messages_received = metrics.register(Counter(
+    'tabletap_listener_messages_received_total', 'MQTT messages received on the printer topic.'))
+orders_total = metrics.register(Counter(
+    'tabletap_listener_orders_total', 'Orders handled, by result.', ['result']))
+stage_seconds = metrics.register(Histogram(
+    'tabletap_listener_stage_seconds', 'Time spent in each stage of the print pipeline.', ['stage', 'station']))
+order_latency_seconds = metrics.register(Histogram(
+    'tabletap_listener_order_latency_seconds', 'From the order timestamp to its last ticket printed.'))
+metrics.register(Gauge(
+    'tabletap_listener_queue_depth', 'Jobs waiting in each print queue.',
+    lambda: {(w.name,): w.queue.qsize() for w in all_workers()}, ['queue']))
+catchup_orders = metrics.register(Counter(
+    'tabletap_listener_catchup_orders_total', 'Orders drained through catch-up mode after a reconnect or restart.'))
+metrics.register(Gauge(
+    'tabletap_listener_backlog_size', 'Orders buffered in catch-up mode, waiting to be drained.',
+    lambda: backlog.backlog_size() if backlog else 0))
+metrics.register(Gauge(
+    'tabletap_listener_catchup_active', '1 while catch-up mode is buffering or draining a backlog.',
+    lambda: 1 if backlog and backlog.active else 0))
+metrics.register(Gauge(
+    'tabletap_listener_catchup_drain_rate', 'Orders per second drained by the current (or last) catch-up.',
+    lambda: backlog.current_rate if backlog else 0))
+metrics.register(Gauge(
+    'tabletap_listener_mqtt_connected', '1 while connected to AWS IoT Core.',
+    lambda: 1 if connection_state['connected'] else 0))
+metrics.register(Gauge(
+    'tabletap_listener_queue_dropped_jobs', 'Jobs dropped because a print queue was full.',
+    lambda: {(w.name,): w.stats.dropped for w in all_workers()}, ['queue']))
+
+def observe_stage(timings, stage, seconds, station=''):
+    """Records a stage duration in the histogram and in the order's timing log."""
+    stage_seconds.observe(seconds, stage=stage, station=station)
+    if timings is not None:
+        timings[f"{station}.{stage}_ms" if station else f"{stage}_ms"] = round(seconds * 1000, 1)
+
+def add_trace_breakdown(timings, trace, received_ts):
+    """Adds the Lambda-side hops from the order's trace context to `timings`.
+
+    Cross-machine hops compare the Lambda's clock with this machine's, so
+    they're only as accurate as NTP on the listener box.
+    """
+    if not isinstance(trace, dict):
+        return
+    for step, ms in (trace.get('steps') or {}).items():
+        timings[f"lambda.{step}"] = ms
+    ingest_ts, publish_ts, source_ts = trace.get('ingest_ts'), trace.get('publish_ts'), trace.get('source_ts')
+    if source_ts and ingest_ts:
+        observe_stage(timings, 'payment_to_lambda', max(0.0, ingest_ts - source_ts))
+    if ingest_ts and publish_ts:
+        observe_stage(timings, 'lambda_ingest_to_publish', max(0.0, publish_ts - ingest_ts))
+    if publish_ts:
+        observe_stage(timings, 'iot_publish_to_receive', max(0.0, received_ts - publish_ts))
+
+def order_timestamp(order_data):
+    """The order's timestamp (orderDate, ISO 8601) as epoch seconds, or None."""
+    order_date = order_data.get('orderDate') if isinstance(order_data, dict) else None
+    if not order_date:
+        return None
+    try:
+        return datetime.fromisoformat(str(order_date).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+def order_age_seconds(order_data):
+    """Seconds since the order's timestamp, or None."""
+    ts = order_timestamp(order_data)
+    return None if ts is None else time.time() - ts
 
 # --- NEW: Modern Printer Logic ---
-def print_order(order_data):
-    """Prints a single, complete order with modern formatting."""
+def print_order(order_data, station=None, timings=None):
+    """Prints a single, complete order with modern formatting.
+
+    The whole ticket is rendered into one ESC/POS buffer first and then sent
+    to the station's printer in a single bulk write.
+    """
+    station = station or router.default_printer
+    p = printers.get(station)
     if p is None:
-        logging.warning("Printer not initialized. Cannot print order.")
+        logging.warning(f"Printer '{station}' not initialized. Cannot print order.")
+        printer_faults.add(station)
         return False
 
     try:
-        logging.info("Printing new modern order...")
-
-        # Extract data from the payload
-        items = order_data.get('items', [])
-        notes = order_data.get('notes', '')
-        order_type = order_data.get('orderType', 'dine-in').upper()
-        table = order_data.get('table', 'N/A')
-        order_number = order_data.get('order_id', '----')
-
-        # --- Receipt Header ---
-        p.set(align='center', font='a', bold=True, width=2, height=2)
-        p.text(f"{order_type} ORDER\n")
-
-        # --- Order Details ---
-        p.set(align='center', font='a', bold=False, width=1, height=1)
-        p.text("=" * 42 + "\n")
-
-        if order_type == 'DINE-IN':
-            p.set(align='left', font='a', bold=True, width=2, height=2)
-            table_name = table.replace('table-', 'Table ')
-            p.text(f"{table_name}\n")
-        else: # Takeout
-            p.set(align='left', font='a', bold=True, width=2, height=2)
-            p.text("TAKEOUT\n")
-            p.set(align='left', font='b', bold=True, width=1, height=1)
-            p.text("-- PAID --\n")
-
-        p.set(align='center', font='a', bold=False, width=1, height=1)
-        p.text("-" * 42 + "\n")
-        p.set(align='left', font='b')
-        p.text(f"Order #: {order_number}\n")
-        p.text(f"Time: {datetime.now().strftime('%I:%M %p')}\n")
-        p.text("=" * 42 + "\n\n")
-
-        # --- Special Notes ---
-        if notes:
-            p.set(align='center', font='a', bold=True, width=1, height=2)
-            p.text("!! NOTES !!\n")
-            p.set(align='left', font='b', bold=True, width=1, height=1)
-            p.text(f"{notes}\n")
-            p.text("=" * 42 + "\n\n")
-
-        # --- Item List ---
-        if not items:
-            p.text("No items in this order.\n")
-        else:
-            for item in items:
-                item_name = item.get('name', 'Unknown Item')
-                quantity = item.get('quantity', 1)
-                options = item.get('options', '')
-
-                p.set(align='left', font='a', bold=True, width=2, height=2)
-                p.text(f"{quantity}x {item_name}\n")
-
-                if options:
-                    p.set(align='left', font='b', bold=False, width=1, height=1)
-                    # Indent options for clarity
-                    formatted_options = options.replace('; ', '\n  - ')
-                    p.text(f"  - {formatted_options}\n")
-                p.text("\n") # Add space between items
-
-        # --- Footer ---
-        p.cut()
+        logging.info(f"Printing new modern order on '{station}'...")
+        started = time.perf_counter()
+        ticket = render_ticket(order_data, branding=brandings.get(station))
+        rendered = time.perf_counter()
+        p._raw(ticket) # Ticket and cut in one transfer
+        written = time.perf_counter()
+        observe_stage(timings, 'render', rendered - started, station)
+        observe_stage(timings, 'usb_write', written - rendered, station)
+        logging.info(f"Sent {len(ticket)} byte ticket to '{station}'")
         return True
     except Exception as e:
         logging.error("Could not print order.", exc_info=True)
+        printer_faults.add(station) # Unplugged or powered off: reopen it before retrying
         return False
 
+def open_printer(spec):
+    """Returns (escpos device, NV state key) for a printer spec."""
+    backend = spec.get('backend', 'usb')
+    profile = spec.get('profile', 'RP326')
+    if backend == 'dummy':
+        return Dummy(profile=profile), None # Fresh every run: nothing to remember
+    if backend == 'file':
+        path = os.path.join(script_dir, spec['path'])
+        return File(path, profile=profile), f"file:{path}"
+    vendor_id, product_id = usb_ids(spec)
+    return Usb(vendor_id, product_id, profile=profile), f"usb:{vendor_id:04x}:{product_id:04x}"
+
+def set_up_branding(name, device, nv_key):
+    """Uploads the printer's logo to NV memory if needed and builds its TicketBranding."""
+    options = router.branding_for(name)
+    logo = None
+    if options.get('logo'):
+        try:
+            ink = load_logo(os.path.join(script_dir, options['logo']))
+            logo = nv_store.ensure(nv_key or f"dummy:{name}", device, ink, persist=nv_key is not None)
+        except Exception as e:
+            logging.warning(f"Could not set up the logo on '{name}'; printing without it: {e}", exc_info=True)
+    headers = None
+    if options.get('raster_headers'):
+        font = options.get('header_font')
+        try:
+            if font not in header_caches: # Printers with the same font share rendered headers
+                header_caches[font] = HeaderRasterCache(os.path.join(script_dir, font) if font else None)
+            headers = header_caches[font]
+        except Exception as e:
+            logging.warning(f"Could not load header font for '{name}'; using text headers: {e}", exc_info=True)
+    if logo or headers:
+        brandings[name] = TicketBranding(logo=logo, headers=headers)
+
+def connect_printer(name):
+    """(Re)opens one printer and its branding; returns True if it opened."""
+    try:
+        device, nv_key = open_printer(router.printers[name])
+    except Exception as e:
+        logging.warning(f"Could not initialize printer '{name}': {e}", exc_info=True)
+        printers[name] = None
+        return False
+    set_up_branding(name, device, nv_key)
+    printers[name] = device
+    printer_faults.discard(name)
+    logging.info(f"✓ Printer '{name}' initialized successfully")
+    return True
+
+def open_printers():
+    global nv_store
+    nv_store = NvLogoStore(NV_STATE_PATH)
+    for name in router.printers:
+        connect_printer(name)
+
+# --- Printer Recovery ---
+def schedule_retry(job, failed_stations=()):
+    """Keeps an order that didn't fully print until its printers are back."""
+    with retry_lock:
+        retry_jobs.append((job, set(failed_stations)))
+
+def recover_printers():
+    """Reopens printers that failed and re-queues the orders they missed.
+
+    Runs every PRINTER_RETRY_SECONDS, so an unplugged printer starts printing
+    again once it's plugged back in, without restarting the listener.
+    Stations that already printed an order are skipped by handle_print_job.
+    """
+    for name in router.printers:
+        if printers.get(name) is not None and name not in printer_faults:
+            continue
+        old = printers.get(name)
+        if old is not None:
+            try:
+                old.close()
+            except Exception:
+                pass # The handle is dead anyway
+        if connect_printer(name):
+            logging.info(f"✓ Printer '{name}' reopened")
+    with retry_lock:
+        down = {name for name in router.printers if printers.get(name) is None or name in printer_faults}
+        ready = [job for job, failed in retry_jobs if not failed & down]
+        retry_jobs[:] = [(job, failed) for job, failed in retry_jobs if failed & down]
+    if not ready:
+        return
+    logging.info(f"Retrying {len(ready)} unprinted order(s)...")
+    if backlog is not None:
+        backlog.begin('printer recovered') # Oldest first, at the catch-up rate
+    for job in ready:
+        enqueue_job(PrintJob(payload=job.payload, topic=job.topic, spool_id=job.spool_id, content_type=job.content_type))
+
+def printer_recovery_loop():
+    while not shutdown_event.wait(PRINTER_RETRY_SECONDS):
+        try:
+            recover_printers()
+        except Exception:
+            logging.error("Printer recovery failed.", exc_info=True)
+
+# --- Print Workers ---
+def handle_print_job(job):
+    """Runs on the intake worker: parses a queued message and routes its tickets.
+
+    Each station's ticket goes onto that printer's own queue, so stations
+    print concurrently. Tickets are tracked per station: a redelivery or
+    replay only prints the stations that haven't printed yet, and the order
+    only counts as printed (spool marked done) once every station has.
+    """
+    timings = {}
+    started = time.monotonic()
+    observe_stage(timings, 'intake_wait', started - job.received_at)
+    try:
+        order_data = decode_print_job(job.payload, job.content_type)
+    except (json.JSONDecodeError, CodecError, UnicodeDecodeError):
+        logging.error(f"Discarding malformed message from '{job.topic}'", exc_info=True)
+        orders_total.inc(result='malformed')
+        mark_spooled_done(job) # Replaying it would never succeed
+        return False
+    observe_stage(timings, 'parse', time.monotonic() - started)
+    trace = order_data.get('trace') if isinstance(order_data, dict) else None
+    add_trace_breakdown(timings, trace, job.received_ts)
+
+    order_id = order_key(order_data)
+    tickets = router.split(order_data)
+    printed = printed_stations(job, order_id, tickets)
+    if printed:
+        tickets = {station: ticket for station, ticket in tickets.items() if station not in printed}
+        if not tickets:
+            logging.info(f"Skipping duplicate delivery of order {order_id or job.spool_id}")
+            orders_total.inc(result='duplicate')
+            mark_spooled_done(job)
+            return True
+        logging.info(f"Order {order_id or job.spool_id} already printed on {sorted(printed)}; "
+                     f"printing only {sorted(tickets)}")
+
+    logging.info(f"Processing order: {order_id or 'N/A'}")
+    if order_id:
+        for station in tickets: # Claimed now so a redelivery during printing is skipped
+            dedupe.add((order_id, station))
+
+    failed_stations = set()
+
+    def on_ticket_done(station, ok):
+        if ok:
+            mark_ticket_done(job, station)
+            return
+        failed_stations.add(station)
+        if order_id:
+            dedupe.discard((order_id, station)) # Let a redelivery or replay try this station again
+
+    def on_order_done(all_ok):
+        observe_stage(timings, 'receive_to_printed', time.monotonic() - job.received_at)
+        age = order_age_seconds(order_data)
+        if age is not None and age >= 0:
+            order_latency_seconds.observe(age)
+            timings['order_to_printed_ms'] = round(age * 1000, 1)
+        if isinstance(trace, dict) and (trace.get('source_ts') or trace.get('ingest_ts')):
+            start_ts = trace.get('source_ts') or trace.get('ingest_ts')
+            timings['payment_to_paper_ms'] = round((time.time() - start_ts) * 1000, 1)
+        logging.info("order_timing " + json.dumps({
+            'order_id': order_id,
+            'ok': all_ok,
+            'request_id': trace.get('request_id') if isinstance(trace, dict) else None,
+            **timings,
+        }))
+        if all_ok:
+            logging.info(f"✓ Order {order_id or 'N/A'} printed successfully")
+            orders_total.inc(result='printed')
+            mark_spooled_done(job)
+        else:
+            logging.warning(f"✗ Failed to print order {order_id or 'N/A'}; retrying once {sorted(failed_stations)} is back")
+            orders_total.inc(result='failed')
+            schedule_retry(job, failed_stations)
+
+    group = TicketGroup(len(tickets), on_order_done, timings, on_ticket=on_ticket_done)
+    for station, ticket_order in tickets.items():
+        if not station_workers[station].submit(TicketJob(ticket_order, station, group)):
+            group.finish(False, station)
+    return True
+
+def handle_ticket_job(job):
+    """Runs on a station's printer worker."""
+    timings = job.group.timings if job.group else None
+    observe_stage(timings, 'station_wait', time.monotonic() - job.received_at, job.station)
+    ok = print_order(job.order_data, job.station, timings)
+    job.group.finish(ok, job.station)
+    return ok
+
+def order_key(order_data):
+    """The id used to recognise redeliveries of the same order."""
+    if not isinstance(order_data, dict):
+        return None
+    return order_data.get('order_id') or order_data.get('orderId')
+
+def printed_stations(job, order_id, tickets):
+    """Stations among `tickets` that already printed this order (this spool row, or an earlier delivery)."""
+    printed = set()
+    if spool is not None and job.spool_id is not None:
+        try:
+            printed = spool.printed_stations(job.spool_id)
+        except Exception:
+            logging.error(f"Could not read printed stations of spooled order {job.spool_id}.", exc_info=True)
+    if order_id:
+        printed.update(station for station in tickets if dedupe.seen((order_id, station)))
+    return printed & set(tickets)
+
+def mark_ticket_done(job, station):
+    if spool is None or job.spool_id is None:
+        return
+    try:
+        spool.mark_ticket_done(job.spool_id, station)
+    except Exception:
+        logging.error(f"Could not record '{station}' ticket of spooled order {job.spool_id} as printed.", exc_info=True)
+
+def mark_spooled_done(job):
+    if spool is None or job.spool_id is None:
+        return
+    try:
+        spool.mark_done(job.spool_id)
+    except Exception:
+        logging.error(f"Could not mark spooled order {job.spool_id} as printed.", exc_info=True)
+
+def load_printed_order_ids():
+    """Seeds the dedupe cache from the spool so redeliveries are caught across restarts."""
+    for payload, station, printed_at in spool.printed_since(time.time() - DEDUPE_TTL_SECONDS):
+        try:
+            order_data = decode_print_job(payload)
+        except (json.JSONDecodeError, CodecError, UnicodeDecodeError):
+            continue
+        order_id = order_key(order_data)
+        if not order_id:
+            continue
+        # Orders spooled before per-station records count as printed everywhere
+        for printed_station in [station] if station else router.split(order_data):
+            dedupe.add((order_id, printed_station), added_at=printed_at)
+    if len(dedupe):
+        logging.info(f"Loaded {len(dedupe)} recently printed ticket(s) for de-duplication")
+
+def replay_spool():
+    """Re-queues every spooled order that was never printed (e.g. after a crash)."""
+    pending = spool.pending()
+    if not pending:
+        return
+    logging.info(f"Replaying {len(pending)} unprinted order(s) from the spool...")
+    backlog.begin('spool replay')
+    for spool_id, topic, payload, _ in pending:
+        enqueue_job(PrintJob(payload=payload, topic=topic, spool_id=spool_id))
+
+# --- Catch-up Mode ---
+def enqueue_job(job):
+    """Buffers the job while catching up on a backlog, otherwise queues it for printing."""
+    if backlog is None or not backlog.add(job):
+        if not intake_worker.submit(job):
+            schedule_retry(job)
+
+def submit_from_backlog(job):
+    intake_worker.submit(job, timeout=None) # Drained at a controlled rate, so wait rather than drop
+    catchup_orders.inc()
+
+def backlog_sort_key(job):
+    """Order timestamp of a buffered job; falls back to when it was received."""
+    try:
+        ts = order_timestamp(decode_print_job(job.payload, job.content_type))
+    except (json.JSONDecodeError, CodecError, UnicodeDecodeError):
+        ts = None
+    return ts if ts is not None else job.received_ts
+
+def printers_busy():
+    """True while any print queue is half full; the catch-up drain pauses until it clears."""
+    return any(w.queue.qsize() >= w.queue.maxsize // 2 for w in all_workers())
+
 # --- MQTT5 Callback ---
 def on_publish_received(publish_packet_data):
-    """Callback when a new order is received."""
+    """Callback when a new order is received.
+
+    Runs on the MQTT event loop, so it only spools the raw payload, hands it
+    to the intake worker and returns immediately.
+    """
     publish_packet = publish_packet_data.publish_packet
-    payload = publish_packet.payload
     logging.info(f"Received message from topic: '{publish_packet.topic}'")
+    messages_received.inc()
 
     try:
-        order_data = json.loads(payload)
-        logging.info(f"Processing order: {order_data.get('orderNumber', 'N/A')}")
-        
-        if print_order(order_data):
-            logging.info("✓ Order printed successfully")
-        else:
-            logging.warning("✗ Failed to print order")
-
+        spool_id = None
+        try:
+            spool_id = spool.append(publish_packet.payload, publish_packet.topic)
+        except Exception:
+            logging.error("Could not write order to the spool; printing without it.", exc_info=True)
+        enqueue_job(PrintJob(
+            payload=publish_packet.payload,
+            topic=publish_packet.topic,
+            spool_id=spool_id,
+            content_type=publish_packet.content_type,
+        ))
     except Exception as e:
         logging.error("An unexpected error occurred in on_publish_received.", exc_info=True)
 
@@ -169,13 +481,75 @@ def on_lifecycle_stopped(lifecycle_stopped_data: mqtt5.LifecycleStoppedData):
     future_stopped.set_result(lifecycle_stopped_data)
 
 def on_lifecycle_connection_success(lifecycle_connect_success_data: mqtt5.LifecycleConnectSuccessData):
-    logging.info("Lifecycle Connection Success")
+    connack = lifecycle_connect_success_data.connack_packet
+    session_present = bool(connack and connack.session_present)
+    reconnect = connection_state['ever_connected']
+    disconnected_at = connection_state['disconnected_at']
+    logging.info(f"Lifecycle Connection Success (session present: {session_present})")
+    if disconnected_at is not None:
+        logging.info(f"Reconnected after {time.monotonic() - disconnected_at:.0f}s offline")
+    connection_state.update(connected=True, ever_connected=True, disconnected_at=None)
+
+    # A resumed session means the broker is about to redeliver what it queued
+    # while we were away; catch up on it instead of printing the burst as-is.
+    if session_present or reconnect:
+        backlog.begin('session resumed' if session_present else 'reconnected')
+    if reconnect and not session_present:
+        # The session expired: the subscription is gone and orders published
+        # while offline were not kept by the broker
+        logging.warning(f"MQTT session was not resumed (offline longer than {SESSION_EXPIRY_SECONDS}s?); re-subscribing")
+        connection_state['subscribed'] = False
+    if reconnect and not connection_state['subscribed']:
+        resubscribe()
     if not future_connection_success.done():
         future_connection_success.set_result(lifecycle_connect_success_data)
 
 def on_lifecycle_connection_failure(lifecycle_connection_failure: mqtt5.LifecycleConnectFailureData):
     logging.error(f"Lifecycle Connection Failure: {lifecycle_connection_failure.exception}")
 
+def on_lifecycle_disconnection(lifecycle_disconnect_data: mqtt5.LifecycleDisconnectData):
+    logging.warning(f"Lifecycle Disconnected: {lifecycle_disconnect_data.exception}")
+    connection_state['connected'] = False
+    if connection_state['disconnected_at'] is None:
+        connection_state['disconnected_at'] = time.monotonic()
+
+def subscribe(mqtt_client):
+    return mqtt_client.subscribe(subscribe_packet=mqtt5.SubscribePacket(
+        subscriptions=[mqtt5.Subscription(topic_filter=PRINTER_TOPIC, qos=mqtt5.QoS.AT_LEAST_ONCE)]
+    ))
+
+def resubscribe(attempt=1):
+    """Subscribes again without blocking the MQTT callback thread, retrying until the broker accepts.
+
+    A failure while disconnected is left to the next connection success,
+    which re-subscribes whenever the last attempt didn't go through.
+    """
+    def on_suback(future):
+        try:
+            reason_code = future.result().reason_codes[0]
+            if reason_code.value >= 0x80: # Granted QoS is 0-2; 0x80 and up are refusals
+                raise RuntimeError(f"subscription refused ({reason_code.name})")
+        except Exception as e:
+            if shutdown_event.is_set():
+                return
+            if not connection_state['connected']:
+                logging.warning(f"✗ Re-subscribe failed while offline ({e}); retrying on reconnect")
+                return
+            logging.error(f"✗ Re-subscribe attempt {attempt} failed: {e}; retrying in {RESUBSCRIBE_RETRY_SECONDS}s")
+            retry = threading.Timer(RESUBSCRIBE_RETRY_SECONDS, resubscribe, args=(attempt + 1,))
+            retry.daemon = True
+            retry.start()
+            return
+        connection_state['subscribed'] = True
+        logging.info(f"✓ Re-subscribed to '{PRINTER_TOPIC}' with {reason_code}")
+
+    try:
+        subscribe(client).add_done_callback(on_suback)
+    except Exception as e: # Client stopping or not connected; surface it like a failed SUBACK
+        failed = Future()
+        failed.set_exception(e)
+        on_suback(failed)
+
 def signal_handler(sig, frame):
     logging.info("\nShutdown signal received. Shutting down gracefully...")
     shutdown_event.set()
@@ -185,14 +559,33 @@ if __name__ == '__main__':
     logging.info("\n--- Starting Unified MQTT Printer Client ---")
     signal.signal(signal.SIGINT, signal_handler)
 
-    try:
-        p = Usb(0x0FE6, 0x811E, profile="RP326")
-        logging.info("✓ Printer initialized successfully")
-    except Exception as e:
-        logging.warning(f"Could not initialize printer: {e}", exc_info=True)
-        p = None
+    if METRICS_PORT:
+        start_metrics_server(metrics, METRICS_PORT)
+        logging.info(f"✓ Metrics available on http://0.0.0.0:{METRICS_PORT}/metrics")
+
+    router = PrinterRouter.from_file(PRINTER_CONFIG_PATH)
+    open_printers()
+
+    spool = OrderSpool(SPOOL_PATH)
+    purged = spool.purge(SPOOL_RETENTION_SECONDS)
+    if purged:
+        logging.info(f"Purged {purged} old order(s) from the spool")
+
+    for name in router.printers:
+        station_workers[name] = PrinterWorker(handle_ticket_job, maxsize=PRINT_QUEUE_SIZE, name=f"printer-{name}")
+        station_workers[name].start()
+    intake_worker = PrinterWorker(handle_print_job, maxsize=PRINT_QUEUE_SIZE, name='intake')
+    intake_worker.start()
+    backlog = BacklogDrainer(
+        submit_from_backlog, backlog_sort_key,
+        rate=CATCHUP_ORDERS_PER_SECOND, settle=CATCHUP_SETTLE_SECONDS,
+        max_wait=CATCHUP_MAX_WAIT_SECONDS, busy=printers_busy,
+    )
+    backlog.start()
+    load_printed_order_ids()
+    replay_spool()
+    threading.Thread(target=printer_recovery_loop, name='printer-recovery', daemon=True).start()
 
-    client = None
     try:
         client = mqtt5_client_builder.mtls_from_path(
             endpoint=ENDPOINT,
@@ -203,7 +596,16 @@ if __name__ == '__main__':
             on_lifecycle_stopped=on_lifecycle_stopped,
             on_lifecycle_connection_success=on_lifecycle_connection_success,
             on_lifecycle_connection_failure=on_lifecycle_connection_failure,
-            client_id=CLIENT_ID
+            on_lifecycle_disconnection=on_lifecycle_disconnection,
+            client_id=CLIENT_ID,
+            # Persistent session: while we're offline the broker keeps the
+            # subscription and queues QoS-1 orders, and delivers them on rejoin
+            session_behavior=mqtt5.ClientSessionBehaviorType.REJOIN_ALWAYS,
+            connect_options=mqtt5.ConnectPacket(
+                client_id=CLIENT_ID,
+                keep_alive_interval_sec=KEEP_ALIVE_SECONDS,
+                session_expiry_interval_sec=SESSION_EXPIRY_SECONDS,
+            ),
         )
         logging.info("✓ MQTT5 Client created")
 
@@ -213,10 +615,8 @@ if __name__ == '__main__':
         logging.info("✓ Connected to AWS IoT Core!")
 
         logging.info(f"Subscribing to topic '{PRINTER_TOPIC}'...")
-        subscribe_future = client.subscribe(subscribe_packet=mqtt5.SubscribePacket(
-            subscriptions=[mqtt5.Subscription(topic_filter=PRINTER_TOPIC, qos=mqtt5.QoS.AT_LEAST_ONCE)]
-        ))
-        suback = subscribe_future.result(TIMEOUT)
+        suback = subscribe(client).result(TIMEOUT)
+        connection_state['subscribed'] = True
         logging.info(f"✓ Subscribed with {suback.reason_codes[0]}")
         logging.info("\n🖨️  Printer is ready and waiting for orders...")
         shutdown_event.wait()
@@ -227,4 +627,9 @@ if __name__ == '__main__':
             logging.info("Stopping client...")
             client.stop()
             future_stopped.result(TIMEOUT)
-            logging.info("✓ Client stopped")
\ No newline at end of file
+            logging.info("✓ Client stopped")
+        backlog.stop()
+        intake_worker.stop()
+        for worker in station_workers.values():
+            worker.stop()
+        spool.close()
\ No newline at end of file
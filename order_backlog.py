@@ -0,0 +1,160 @@
+# order_backlog.py
+#
+# Catch-up mode for the listener. After the internet drops and the MQTT
+# session is rejoined, the broker delivers every queued QoS-1 order in one
+# burst. Instead of pushing that burst straight into the print queues (where
+# it would overflow them and print in arrival order), the backlog collects it,
+# waits for the burst to settle and then feeds it to the printers oldest order
+# first at a steady rate.
+
+import time
+import heapq
+import logging
+import threading
+from itertools import count
+
+
+class BacklogDrainer(threading.Thread):
+    """Buffers jobs while catch-up mode is on and drains them in timestamp order.
+
+    `submit(job)` hands a job to the print pipeline (it may block).
+    `sort_key(job)` returns the job's order timestamp; it runs on the drainer
+    thread, never on the caller of add(). `busy()`, if given, returns True
+    while downstream queues are too deep, pausing the drain.
+    """
+
+    def __init__(self, submit, sort_key, rate=2.0, settle=2.0, max_wait=15.0, busy=None, name='catch-up'):
+        super().__init__(name=name, daemon=True)
+        self.submit = submit
+        self.sort_key = sort_key
+        self.rate = rate
+        self.settle = settle
+        self.max_wait = max_wait
+        self.busy = busy or (lambda: False)
+        self._cond = threading.Condition()
+        self._incoming = []
+        self._heap = []
+        self._seq = count()
+        self._active = False
+        self._started_at = 0.0
+        self._last_add = 0.0
+        self._stopping = False
+        self.current_rate = 0.0 # Orders/s of the catch-up in progress (or the last one), after its first order
+
+    @property
+    def active(self):
+        return self._active
+
+    def backlog_size(self):
+        with self._cond:
+            return len(self._incoming) + len(self._heap)
+
+    def begin(self, reason):
+        """Switches to catch-up mode; jobs added from now on are buffered."""
+        with self._cond:
+            now = time.monotonic()
+            if not self._active:
+                self._active = True
+                self._started_at = now
+                logging.info(f"Catch-up mode on ({reason}); buffering orders until the burst settles")
+            self._last_add = now
+            self._cond.notify()
+
+    def add(self, job):
+        """Buffers `job` if catch-up mode is on; returns False if the caller should submit it directly."""
+        with self._cond:
+            if not self._active:
+                return False
+            self._incoming.append(job)
+            self._last_add = time.monotonic()
+            self._cond.notify()
+            return True
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._stopping and not self._active:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+            self._wait_for_settle()
+            self._drain()
+
+    def _wait_for_settle(self):
+        """Waits until no job has arrived for `settle` seconds (at most `max_wait`)."""
+        with self._cond:
+            while not self._stopping:
+                now = time.monotonic()
+                quiet_until = self._last_add + self.settle
+                give_up_at = self._started_at + self.max_wait
+                if now >= quiet_until or now >= give_up_at:
+                    return
+                self._cond.wait(min(quiet_until, give_up_at) - now)
+
+    def _take_incoming(self):
+        with self._cond:
+            incoming, self._incoming = self._incoming, []
+        keyed = []
+        for job in incoming:
+            try:
+                key = self.sort_key(job)
+            except Exception:
+                logging.warning("Could not read an order timestamp; draining it last", exc_info=True)
+                key = float('inf')
+            keyed.append((key, next(self._seq), job))
+        with self._cond:
+            for entry in keyed:
+                heapq.heappush(self._heap, entry)
+
+    def _drain(self):
+        self._take_incoming()
+        started = time.monotonic()
+        drained = 0
+        logging.info(f"Catch-up: draining {len(self._heap)} buffered order(s) oldest first at {self.rate:g}/s")
+        interval = 1.0 / self.rate if self.rate > 0 else 0.0
+        next_at = started
+        first_at = None # The first order goes out at once, so the rate is timed from it
+        self.current_rate = 0.0
+        while not self._stopping:
+            self._take_incoming() # Orders arriving mid-drain still go in timestamp order
+            with self._cond:
+                if not self._heap:
+                    if self._incoming:
+                        continue
+                    self._active = False
+                    break
+                _, _, job = heapq.heappop(self._heap)
+            while self.busy() and not self._stopping:
+                time.sleep(0.1)
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_at = max(next_at + interval, time.monotonic())
+            try:
+                self.submit(job)
+            except Exception:
+                logging.error("Could not submit a buffered order", exc_info=True)
+            drained += 1
+            now = time.monotonic()
+            if first_at is None:
+                first_at = now
+            elif now > first_at:
+                self.current_rate = (drained - 1) / (now - first_at)
+        elapsed = time.monotonic() - started
+        logging.info(f"✓ Catch-up complete: {drained} order(s) in {elapsed:.1f}s ({self.current_rate:.2f}/s)")
+
+    def stop(self, timeout=10):
+        """Hands anything still buffered to `submit` and stops the thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self.join(timeout)
+        if self.is_alive():
+            logging.warning("Catch-up drainer still busy after stop(); flushing the backlog alongside it")
+        self._take_incoming()
+        while True:
+            with self._cond: # The drainer may still be popping if join() timed out
+                if not self._heap:
+                    break
+                job = heapq.heappop(self._heap)[2]
+            self.submit(job)
@@ -0,0 +1,62 @@
+# order_dedupe.py
+#
+# Drops QoS-1 redeliveries of orders that were already printed. The listener
+# subscribes AT_LEAST_ONCE, so after a reconnect the broker may resend messages
+# we already handled; without this the kitchen gets the same ticket twice.
+# The listener keys it by (order id, station), so an order whose tickets only
+# partly printed can be retried without reprinting the stations that worked.
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class DedupeCache:
+    """Bounded LRU of recently printed keys (order ids, or any hashable) with a time-to-live.
+
+    Lookups and inserts are O(1). Entries expire after `ttl` seconds and the
+    oldest entry is evicted once `maxsize` is reached, so memory stays bounded
+    no matter how long the listener runs.
+    """
+
+    def __init__(self, maxsize=2000, ttl=6 * 3600, clock=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, order_id):
+        """True if `order_id` was added within the last `ttl` seconds."""
+        with self._lock:
+            added_at = self._entries.get(order_id)
+            if added_at is None:
+                return False
+            if self._clock() - added_at > self.ttl:
+                del self._entries[order_id]
+                return False
+            self._entries.move_to_end(order_id)
+            return True
+
+    def add(self, order_id, added_at=None):
+        with self._lock:
+            self._entries[order_id] = self._clock() if added_at is None else added_at
+            self._entries.move_to_end(order_id)
+            self._evict()
+
+    def discard(self, order_id):
+        with self._lock:
+            self._entries.pop(order_id, None)
+
+    def _evict(self):
+        cutoff = self._clock() - self.ttl
+        # Least recently used entries sit at the front; anything expired further
+        # back is dropped lazily by seen()
+        while self._entries:
+            oldest_id, oldest_at = next(iter(self._entries.items()))
+            if len(self._entries) <= self.maxsize and oldest_at >= cutoff:
+                break
+            del self._entries[oldest_id]
+
+    def __len__(self):
+        return len(self._entries)
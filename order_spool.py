@@ -0,0 +1,141 @@
+# order_spool.py
+#
+# Durable local record of every order the listener receives. Orders are
+# written to the spool before printing and marked done afterwards, so anything
+# received while the printer is unplugged (or while the listener crashes) is
+# replayed on the next startup, or retried by the listener once the printer
+# is back. Each station's ticket is also recorded as it prints, so a replay
+# only reprints the stations that failed.
+#
+# Backed by SQLite in WAL mode with synchronous=NORMAL: each append is a cheap
+# WAL append with no fsync, and a background thread checkpoints (fsyncs) the
+# WAL every `sync_interval` seconds on its own connection, so appends from the
+# MQTT callback never wait behind the fsync. A process crash loses nothing; a
+# power cut loses at most the last interval.
+
+import time
+import sqlite3
+import logging
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spool (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    received_at REAL NOT NULL,
+    topic       TEXT NOT NULL,
+    payload     BLOB NOT NULL,
+    printed_at  REAL
+);
+CREATE INDEX IF NOT EXISTS spool_pending ON spool (id) WHERE printed_at IS NULL;
+CREATE TABLE IF NOT EXISTS spool_tickets (
+    spool_id    INTEGER NOT NULL,
+    station     TEXT NOT NULL,
+    printed_at  REAL NOT NULL,
+    PRIMARY KEY (spool_id, station)
+);
+CREATE INDEX IF NOT EXISTS spool_tickets_printed ON spool_tickets (printed_at);
+"""
+
+
+class OrderSpool:
+    def __init__(self, path, sync_interval=1.0):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # Checkpoints run on a separate connection and lock: a PASSIVE
+        # checkpoint doesn't block WAL writers, so append() can proceed meanwhile
+        self._sync_lock = threading.Lock()
+        self._sync_conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._closed = threading.Event()
+        self._syncer = threading.Thread(target=self._sync_loop, args=(sync_interval,), name='spool-sync', daemon=True)
+        self._syncer.start()
+
+    def append(self, payload, topic=''):
+        """Records a received message and returns its spool id."""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO spool (received_at, topic, payload) VALUES (?, ?, ?)",
+                (time.time(), topic, bytes(payload)),
+            )
+            return cur.lastrowid
+
+    def mark_done(self, spool_id):
+        with self._lock:
+            self._conn.execute("UPDATE spool SET printed_at = ? WHERE id = ?", (time.time(), spool_id))
+
+    def mark_ticket_done(self, spool_id, station):
+        """Records that one station's ticket of a spooled order has printed."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO spool_tickets (spool_id, station, printed_at) VALUES (?, ?, ?)",
+                (spool_id, station, time.time()),
+            )
+
+    def printed_stations(self, spool_id):
+        """Stations whose ticket for this spooled order has already printed."""
+        with self._lock:
+            rows = self._conn.execute("SELECT station FROM spool_tickets WHERE spool_id = ?", (spool_id,)).fetchall()
+        return {station for (station,) in rows}
+
+    def pending(self):
+        """Returns (id, topic, payload, received_at) for every unprinted order, oldest first."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, topic, payload, received_at FROM spool WHERE printed_at IS NULL ORDER BY id"
+            ).fetchall()
+
+    def printed_since(self, since):
+        """Returns (payload, station, printed_at) for tickets printed after `since` (epoch seconds), oldest first.
+
+        `station` is None for orders marked done without per-station records
+        (spooled before those existed); the whole order counts as printed.
+        """
+        with self._lock:
+            return self._conn.execute(
+                """
+                SELECT s.payload, t.station, t.printed_at
+                FROM spool_tickets t JOIN spool s ON s.id = t.spool_id
+                WHERE t.printed_at >= ?
+                UNION ALL
+                SELECT s.payload, NULL, s.printed_at FROM spool s
+                WHERE s.printed_at >= ? AND NOT EXISTS (SELECT 1 FROM spool_tickets t WHERE t.spool_id = s.id)
+                ORDER BY 3
+                """,
+                (since, since),
+            ).fetchall()
+
+    def purge(self, max_age_seconds):
+        """Deletes printed orders older than `max_age_seconds`; returns the number removed."""
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM spool WHERE printed_at IS NOT NULL AND printed_at < ?",
+                (time.time() - max_age_seconds,),
+            )
+            self._conn.execute("DELETE FROM spool_tickets WHERE spool_id NOT IN (SELECT id FROM spool)")
+            return cur.rowcount
+
+    def sync(self):
+        """Flushes the WAL to the database file (this is where the fsync happens)."""
+        with self._sync_lock:
+            self._sync_conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def _sync_loop(self, interval):
+        while not self._closed.wait(interval):
+            try:
+                self.sync()
+            except sqlite3.Error:
+                logging.error("Order spool checkpoint failed.", exc_info=True)
+
+    def close(self):
+        self._closed.set()
+        self._syncer.join()
+        with self._sync_lock:
+            self._sync_conn.close()
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.close()
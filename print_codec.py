@@ -0,0 +1,199 @@
+# print_codec.py
+#
+# Compact, versioned binary encoding for print jobs published by the Lambda
+# and decoded by listener.py. Shared by both sides: the backend deploy copies
+# this file into the Lambda package.
+#
+# Layout: MAGIC (b'TT') + version byte, then one tagged value. Values are
+# msgpack-style tags with varint lengths. Every string is interned: the first
+# occurrence is written in full and later ones (repeated keys such as 'name',
+# 'quantity', repeated item names) become a small index. Decimals keep their
+# exact digits instead of being stringified, as json.dumps(default=str) does.
+#
+# The trade-off is CPU: this is pure Python, so decoding is 8-10x slower than
+# json.loads (see benchmarks/bench_print_codec.py). It only pays off when the
+# payload size matters more than a few hundred microseconds per order.
+
+import json
+import struct
+from decimal import Decimal
+
+MAGIC = b'TT'
+VERSION = 1
+HEADER = MAGIC + bytes((VERSION,))
+CONTENT_TYPE = 'application/vnd.tabletap.print-job.v1'
+
+T_NONE, T_FALSE, T_TRUE, T_INT, T_FLOAT, T_DECIMAL, T_STR, T_STR_REF, T_LIST, T_DICT = range(10)
+
+_DOUBLE = struct.Struct('>d')
+
+
+class CodecError(ValueError):
+    pass
+
+
+def _write_varint(out, value):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value):
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+
+class _Encoder:
+    def __init__(self):
+        self.out = bytearray(HEADER)
+        self.strings = {}
+
+    def value(self, obj):
+        out = self.out
+        if obj is None:
+            out.append(T_NONE)
+        elif obj is True:
+            out.append(T_TRUE)
+        elif obj is False:
+            out.append(T_FALSE)
+        elif isinstance(obj, int):
+            out.append(T_INT)
+            _write_varint(out, _zigzag(obj))
+        elif isinstance(obj, float):
+            out.append(T_FLOAT)
+            out += _DOUBLE.pack(obj)
+        elif isinstance(obj, Decimal):
+            if not obj.is_finite():
+                raise CodecError(f"Cannot encode {obj!r}")
+            sign, digits, exponent = obj.as_tuple()
+            coefficient = int(''.join(map(str, digits)) or '0')
+            out.append(T_DECIMAL)
+            _write_varint(out, _zigzag(-coefficient if sign else coefficient))
+            _write_varint(out, _zigzag(exponent))
+        elif isinstance(obj, str):
+            self.string(obj)
+        elif isinstance(obj, (list, tuple)):
+            out.append(T_LIST)
+            _write_varint(out, len(obj))
+            for item in obj:
+                self.value(item)
+        elif isinstance(obj, dict):
+            out.append(T_DICT)
+            _write_varint(out, len(obj))
+            for key, item in obj.items():
+                self.string(str(key))
+                self.value(item)
+        else:
+            # Same fallback the JSON publisher uses
+            self.string(str(obj))
+
+    def string(self, text):
+        index = self.strings.get(text)
+        if index is not None:
+            self.out.append(T_STR_REF)
+            _write_varint(self.out, index)
+            return
+        self.strings[text] = len(self.strings)
+        data = text.encode('utf-8')
+        self.out.append(T_STR)
+        _write_varint(self.out, len(data))
+        self.out += data
+
+
+class _Decoder:
+    def __init__(self, data):
+        self.data = data
+        self.pos = len(HEADER)
+        self.strings = []
+
+    def varint(self):
+        data, pos = self.data, self.pos
+        result = shift = 0
+        while True:
+            if pos >= len(data):
+                raise CodecError("Truncated varint")
+            byte = data[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                self.pos = pos
+                return result
+            shift += 7
+
+    def value(self):
+        if self.pos >= len(self.data):
+            raise CodecError("Truncated payload")
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag == T_NONE:
+            return None
+        if tag == T_TRUE:
+            return True
+        if tag == T_FALSE:
+            return False
+        if tag == T_INT:
+            return _unzigzag(self.varint())
+        if tag == T_FLOAT:
+            (value,) = _DOUBLE.unpack_from(self.data, self.pos)
+            self.pos += _DOUBLE.size
+            return value
+        if tag == T_DECIMAL:
+            coefficient = _unzigzag(self.varint())
+            exponent = _unzigzag(self.varint())
+            digits = tuple(int(d) for d in str(abs(coefficient)))
+            return Decimal((1 if coefficient < 0 else 0, digits, exponent))
+        if tag == T_STR:
+            length = self.varint()
+            if self.pos + length > len(self.data):
+                raise CodecError(f"Truncated string at offset {self.pos}: {length} bytes declared, "
+                                 f"{len(self.data) - self.pos} left")
+            text = bytes(self.data[self.pos:self.pos + length]).decode('utf-8')
+            self.pos += length
+            self.strings.append(text)
+            return text
+        if tag == T_STR_REF:
+            return self.strings[self.varint()]
+        if tag == T_LIST:
+            return [self.value() for _ in range(self.varint())]
+        if tag == T_DICT:
+            count = self.varint()
+            result = {}
+            for _ in range(count):
+                key = self.value()
+                if not isinstance(key, str): # The encoder only writes string keys
+                    raise CodecError(f"Invalid dict key {key!r} before offset {self.pos}")
+                result[key] = self.value()
+            return result
+        raise CodecError(f"Unknown tag {tag} at offset {self.pos - 1}")
+
+
+def encode_print_job(order):
+    """Encodes a print job dict into the compact v1 format."""
+    encoder = _Encoder()
+    encoder.value(order)
+    return bytes(encoder.out)
+
+
+def is_compact(payload):
+    return bytes(payload[:len(MAGIC)]) == MAGIC
+
+
+def decode_print_job(payload, content_type=None):
+    """Decodes a print job in either format.
+
+    The compact format is recognised by its content type or, for spooled
+    payloads that lost it, by the magic prefix (JSON can't start with 'T').
+    """
+    if content_type == CONTENT_TYPE or is_compact(payload):
+        version = payload[len(MAGIC)] if len(payload) > len(MAGIC) else None
+        if version != VERSION:
+            raise CodecError(f"Unsupported print job version {version}")
+        try:
+            return _Decoder(payload).value()
+        except (IndexError, struct.error, UnicodeDecodeError, RecursionError) as e:
+            raise CodecError(f"Corrupt print job: {e}") from e
+    return json.loads(payload)
@@ -0,0 +1,166 @@
+# print_queue.py
+#
+# Bounded hand-off between the MQTT callback thread and the printer. The
+# callback only enqueues the raw message; a dedicated worker thread does the
+# parsing and the (slow) USB I/O so PUBACKs and keep-alives are never held up
+# by the printer.
+
+import time
+import queue
+import logging
+import threading
+from typing import Optional
+from dataclasses import dataclass, field
+
+
+@dataclass
+class PrintJob:
+    payload: bytes
+    topic: str = ''
+    spool_id: Optional[int] = None
+    content_type: Optional[str] = None # MQTT5 content type; JSON or print_codec's compact format
+    received_at: float = field(default_factory=time.monotonic)
+    received_ts: float = field(default_factory=time.time) # Wall clock, compared with the Lambda trace
+
+
+class TicketGroup:
+    """Tracks the per-station tickets split from one order.
+
+    `on_ticket(station, ok)`, if given, is called as each ticket finishes;
+    `on_done(all_ok)` is called exactly once, after every ticket has finished.
+    `timings` is shared by the tickets so each station can add its stage times.
+    """
+
+    def __init__(self, count, on_done, timings=None, on_ticket=None):
+        self._remaining = count
+        self._all_ok = True
+        self._on_done = on_done
+        self._on_ticket = on_ticket
+        self._lock = threading.Lock()
+        self.timings = {} if timings is None else timings
+
+    def finish(self, ok, station=None):
+        if self._on_ticket is not None:
+            self._on_ticket(station, ok)
+        with self._lock:
+            self._all_ok = self._all_ok and ok
+            self._remaining -= 1
+            done = self._remaining == 0
+        if done:
+            self._on_done(self._all_ok)
+
+
+@dataclass
+class TicketJob:
+    order_data: dict
+    station: str
+    group: Optional[TicketGroup] = None
+    received_at: float = field(default_factory=time.monotonic)
+
+
+class PrintQueueStats:
+    """Running backpressure counters for a PrinterWorker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.dropped = 0
+        self.printed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.total_print = 0.0
+
+    def record_enqueue(self, depth):
+        with self._lock:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, depth)
+
+    def record_drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def record_done(self, ok, wait, print_time):
+        with self._lock:
+            if ok:
+                self.printed += 1
+            else:
+                self.failed += 1
+            self.total_wait += wait
+            self.total_print += print_time
+
+    def snapshot(self):
+        with self._lock:
+            done = self.printed + self.failed
+            return {
+                'enqueued': self.enqueued,
+                'dropped': self.dropped,
+                'printed': self.printed,
+                'failed': self.failed,
+                'max_depth': self.max_depth,
+                'avg_wait_ms': (self.total_wait / done * 1000) if done else 0.0,
+                'avg_print_ms': (self.total_print / done * 1000) if done else 0.0,
+            }
+
+
+class PrinterWorker(threading.Thread):
+    """Drains a bounded queue of PrintJobs through `handler` on its own thread.
+
+    `handler(job)` returns True when the job was printed. Exceptions raised by
+    the handler are logged and counted as failures so one bad message can't
+    kill the worker.
+    """
+
+    def __init__(self, handler, maxsize=50, name='printer-worker'):
+        super().__init__(name=name, daemon=True)
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.stats = PrintQueueStats()
+        self._stopping = threading.Event()
+
+    def submit(self, job, timeout=0.5):
+        """Enqueues a job, waiting at most `timeout` seconds for space."""
+        try:
+            self.queue.put(job, timeout=timeout)
+        except queue.Full:
+            self.stats.record_drop()
+            logging.error(f"Queue '{self.name}' full ({self.queue.maxsize}); dropping job")
+            return False
+        depth = self.queue.qsize()
+        self.stats.record_enqueue(depth)
+        if depth > 1:
+            logging.info(f"Queue '{self.name}' depth: {depth}")
+        return True
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                job = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._process(job)
+            self.queue.task_done()
+
+    def _process(self, job):
+        started = time.monotonic()
+        wait = started - job.received_at
+        try:
+            ok = bool(self.handler(job))
+        except Exception:
+            logging.error("Unhandled error in printer worker.", exc_info=True)
+            ok = False
+        print_time = time.monotonic() - started
+        self.stats.record_done(ok, wait, print_time)
+        logging.info(
+            f"[{self.name}] job {'done' if ok else 'FAILED'}: waited {wait * 1000:.0f} ms, "
+            f"printed in {print_time * 1000:.0f} ms, {self.queue.qsize()} still queued"
+        )
+
+    def stop(self, timeout=10):
+        """Lets queued jobs finish (up to `timeout`) and stops the thread."""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stopping.set()
+        self.join(max(0.0, deadline - time.monotonic()) + 1)
+        logging.info(f"Worker '{self.name}' stopped: {self.stats.snapshot()}")
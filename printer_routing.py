@@ -0,0 +1,120 @@
+# printer_routing.py
+#
+# Config-driven routing of order items to kitchen stations. Each station has
+# its own printer (and its own print queue in the listener), so one order can
+# be split into per-station tickets that print concurrently.
+#
+# printers.json (see printers.example.json):
+#
+#   {
+#     "printers": {"sushi-bar": {"usb": ["0x0FE6", "0x811E"], "profile": "RP326"}, ...},
+#     "routes": [{"printer": "sushi-bar", "locations": ["front"]}, ...],
+#     "default_printer": "kitchen"
+#   }
+#
+# Routes are checked in order and the first match wins. Within a route every
+# listed field must match (order_types, locations, categories, names); each
+# field matches if the item's value is any of the listed ones (case-insensitive).
+# Items no route claims go to the default printer.
+#
+# Optional branding (see ticket_images.py) applies to every printer unless a
+# printer spec overrides it:
+#
+#   "logo": "logo.png",          stored in each printer's NV memory, printed on top
+#   "raster_headers": true,      print the big headers as cached bitmaps
+#   "header_font": "bold.ttf"    TrueType font for those headers
+#
+# A printer spec may also pick a backend other than USB:
+#   {"backend": "dummy"}                      bytes kept in memory (testing)
+#   {"backend": "file", "path": "out.bin"}    bytes appended to a file or device
+
+import os
+import json
+import logging
+
+DEFAULT_CONFIG = {
+    'printers': {'kitchen': {'usb': ['0x0FE6', '0x811E'], 'profile': 'RP326'}},
+    'routes': [],
+    'default_printer': 'kitchen',
+}
+
+ROUTE_FIELDS = ('order_types', 'locations', 'categories', 'names')
+BRANDING_KEYS = ('logo', 'raster_headers', 'header_font')
+
+
+def usb_ids(spec):
+    """(vendor_id, product_id) from a printer spec; accepts ints or hex strings."""
+    vendor_id, product_id = spec['usb']
+    return tuple(int(value, 0) if isinstance(value, str) else int(value) for value in (vendor_id, product_id))
+
+
+def item_attributes(item, order_type):
+    """Routing attributes of an item; handles flat items and cart items with a nested menuItem."""
+    menu_item = item.get('menuItem') or {}
+    return {
+        'order_types': order_type,
+        'locations': item.get('location') or menu_item.get('location'),
+        'categories': item.get('category') or menu_item.get('category'),
+        'names': item.get('name') or menu_item.get('name'),
+    }
+
+
+class PrinterRouter:
+    def __init__(self, config=None):
+        config = config or DEFAULT_CONFIG
+        self.printers = dict(config['printers'])
+        self.default_printer = config.get('default_printer') or next(iter(self.printers))
+        self.branding = {key: config[key] for key in BRANDING_KEYS if key in config}
+        self.routes = []
+        for route in config.get('routes', []):
+            if route['printer'] not in self.printers:
+                raise ValueError(f"Route refers to unknown printer '{route['printer']}'")
+            matchers = {
+                field: {str(value).lower() for value in route[field]}
+                for field in ROUTE_FIELDS if field in route
+            }
+            self.routes.append((route['printer'], matchers))
+        if self.default_printer not in self.printers:
+            raise ValueError(f"Unknown default printer '{self.default_printer}'")
+
+    @classmethod
+    def from_file(cls, path):
+        """Loads printers.json, falling back to the single built-in printer if it doesn't exist."""
+        if not os.path.exists(path):
+            logging.info(f"No printer config at {path}; using the default single printer")
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def branding_for(self, printer):
+        """Branding options for one printer: the shared ones, overridden by its spec."""
+        spec = self.printers[printer]
+        return {**self.branding, **{key: spec[key] for key in BRANDING_KEYS if key in spec}}
+
+    def station_for(self, item, order_type):
+        attributes = item_attributes(item, order_type)
+        for printer, matchers in self.routes:
+            if all(str(attributes[field]).lower() in values for field, values in matchers.items()):
+                return printer
+        return self.default_printer
+
+    def split(self, order_data):
+        """Splits an order into {printer name: order dict with just that station's items}.
+
+        Orders that land on a single printer are returned unchanged; split
+        tickets carry a 'station' field so the ticket says where it belongs.
+        """
+        order_type = str(order_data.get('orderType', 'dine-in')).lower()
+        items = order_data.get('items') or []
+        if not items:
+            return {self.default_printer: order_data}
+
+        by_station = {}
+        for item in items:
+            by_station.setdefault(self.station_for(item, order_type), []).append(item)
+        if len(by_station) == 1:
+            return {next(iter(by_station)): order_data}
+        return {
+            station: {**order_data, 'items': station_items, 'station': station}
+            for station, station_items in by_station.items()
+        }
@@ -0,0 +1,172 @@
+# ticket_renderer.py
+#
+# Renders a complete kitchen ticket into a single ESC/POS byte buffer so the
+# listener can flush it to the printer in one bulk write instead of issuing a
+# USB round trip for every set()/text() call.
+
+from datetime import datetime
+
+# --- ESC/POS Command Bytes ---
+ESC = b'\x1b'
+GS = b'\x1d'
+
+INIT = ESC + b'@'
+ALIGN = {'left': ESC + b'a\x00', 'center': ESC + b'a\x01', 'right': ESC + b'a\x02'}
+FONT = {'a': ESC + b'M\x00', 'b': ESC + b'M\x01'}
+BOLD = {False: ESC + b'E\x00', True: ESC + b'E\x01'}
+FULL_CUT = GS + b'V\x00'
+
+LINE_WIDTH = 42
+ENCODING = 'cp437'  # Default code page of the RP326
+
+
+def _size_command(width, height):
+    """GS ! n - character size, width/height multipliers 1-8."""
+    return GS + b'!' + bytes((((width - 1) << 4) | (height - 1),))
+
+
+class TicketBuffer:
+    """In-memory stand-in for an escpos printer that collects raw bytes.
+
+    Mirrors the subset of the python-escpos API used by the listener
+    (set/text/cut) so tickets are composed the same way, but nothing touches
+    the printer until the caller writes getvalue() in one go. Style changes are
+    only emitted when they differ from the current state.
+    """
+
+    def __init__(self, encoding=ENCODING):
+        self.encoding = encoding
+        self._chunks = [INIT]
+        self._align = 'left'
+        self._font = 'a'
+        self._bold = False
+        self._size = (1, 1)
+
+    def set(self, align=None, font=None, bold=None, width=None, height=None):
+        if align is not None and align != self._align:
+            self._chunks.append(ALIGN[align])
+            self._align = align
+        if font is not None and font != self._font:
+            self._chunks.append(FONT[font])
+            self._font = font
+        if bold is not None and bold != self._bold:
+            self._chunks.append(BOLD[bold])
+            self._bold = bold
+        if width is not None or height is not None:
+            size = (width or self._size[0], height or self._size[1])
+            if size != self._size:
+                self._chunks.append(_size_command(*size))
+                self._size = size
+
+    def text(self, txt):
+        self._chunks.append(str(txt).encode(self.encoding, errors='replace'))
+
+    def raw(self, data):
+        self._chunks.append(data)
+
+    def feed(self, lines=1):
+        """ESC d n - print and feed n lines."""
+        self._chunks.append(ESC + b'd' + bytes((lines,)))
+
+    def cut(self, feed=6):
+        self.feed(feed)
+        self._chunks.append(FULL_CUT)
+
+    def getvalue(self):
+        return b''.join(self._chunks)
+
+
+def _header_image(buf, branding, text, align):
+    """Writes `text` as a cached raster header if the branding has one; False otherwise."""
+    image = branding.header(text) if branding is not None else None
+    if image is None:
+        return False
+    buf.set(align=align)
+    buf.raw(image)
+    return True
+
+
+def compose_ticket(buf, order_data, now=None, branding=None):
+    """Writes the kitchen ticket layout for an order into an escpos-like buffer.
+
+    `branding` (see ticket_images.TicketBranding) adds the NV logo and swaps
+    the double-size headers for pre-rasterised images.
+    """
+    items = order_data.get('items', [])
+    notes = order_data.get('notes', '')
+    order_type = order_data.get('orderType', 'dine-in').upper()
+    table = order_data.get('table', 'N/A')
+    order_number = order_data.get('order_id', '----')
+    now = now or datetime.now()
+
+    # --- Receipt Header ---
+    if branding is not None and branding.logo:
+        buf.set(align='center')
+        buf.raw(branding.logo)
+    if not _header_image(buf, branding, f"{order_type} ORDER", 'center'):
+        buf.set(align='center', font='a', bold=True, width=2, height=2)
+        buf.text(f"{order_type} ORDER\n")
+    station = order_data.get('station')
+    if station:
+        buf.set(align='center', font='a', bold=True, width=1, height=1)
+        buf.text(f"[ {station.upper()} ]\n")
+
+    # --- Order Details ---
+    buf.set(align='center', font='a', bold=False, width=1, height=1)
+    buf.text("=" * LINE_WIDTH + "\n")
+
+    if order_type == 'DINE-IN':
+        table_name = str(table).replace('table-', 'Table ')
+        if not _header_image(buf, branding, table_name, 'left'):
+            buf.set(align='left', font='a', bold=True, width=2, height=2)
+            buf.text(f"{table_name}\n")
+    else: # Takeout
+        if not _header_image(buf, branding, "TAKEOUT", 'left'):
+            buf.set(align='left', font='a', bold=True, width=2, height=2)
+            buf.text("TAKEOUT\n")
+        buf.set(align='left', font='b', bold=True, width=1, height=1)
+        buf.text("-- PAID --\n")
+
+    buf.set(align='center', font='a', bold=False, width=1, height=1)
+    buf.text("-" * LINE_WIDTH + "\n")
+    buf.set(align='left', font='b')
+    buf.text(f"Order #: {order_number}\n")
+    buf.text(f"Time: {now.strftime('%I:%M %p')}\n")
+    buf.text("=" * LINE_WIDTH + "\n\n")
+
+    # --- Special Notes ---
+    if notes:
+        buf.set(align='center', font='a', bold=True, width=1, height=2)
+        buf.text("!! NOTES !!\n")
+        buf.set(align='left', font='b', bold=True, width=1, height=1)
+        buf.text(f"{notes}\n")
+        buf.text("=" * LINE_WIDTH + "\n\n")
+
+    # --- Item List ---
+    if not items:
+        buf.text("No items in this order.\n")
+    else:
+        for item in items:
+            item_name = item.get('name', 'Unknown Item')
+            quantity = item.get('quantity', 1)
+            options = item.get('options', '')
+
+            buf.set(align='left', font='a', bold=True, width=2, height=2)
+            buf.text(f"{quantity}x {item_name}\n")
+
+            if options:
+                buf.set(align='left', font='b', bold=False, width=1, height=1)
+                # Indent options for clarity
+                formatted_options = options.replace('; ', '\n  - ')
+                buf.text(f"  - {formatted_options}\n")
+            buf.text("\n") # Add space between items
+
+    # --- Footer ---
+    buf.cut()
+    return buf
+
+
+def render_ticket(order_data, now=None, branding=None):
+    """Returns the full ESC/POS byte stream for an order's kitchen ticket."""
+    return compose_ticket(TicketBuffer(), order_data, now=now, branding=branding).getvalue()
+